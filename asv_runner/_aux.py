@@ -89,9 +89,10 @@ def posix_redirect_output(filename=None, permanent=True):
     Redirect stdout/stderr to a file, using posix `dup2`.
 
     #### Parameters
-    **filename** (`str` or None, optional)
+    **filename** (`str`, `int` or None, optional)
     : The name of the file to redirect the output to. If None, a temporary
-      file will be created.
+      file will be created. An `int` is taken as an open file descriptor (for
+      instance the write end of a pipe), which is left open.
 
     **permanent** (`bool`, optional)
     : Indicates whether the redirection is permanent or temporary. If False,
@@ -124,6 +125,8 @@ def posix_redirect_output(filename=None, permanent=True):
 
     if filename is None:
         out_fd, filename = tempfile.mkstemp()
+    elif isinstance(filename, int):
+        out_fd = os.dup(filename)
     else:
         out_fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
 
@@ -157,7 +160,7 @@ def recvall(sock, size):
     : The size of the data to receive, in bytes.
 
     #### Returns
-    **data** (`bytes`)
+    **data** (`bytearray`)
     : The received data.
 
     #### Raises
@@ -167,19 +170,23 @@ def recvall(sock, size):
     #### Notes
     The function receives data from a socket connection in multiple chunks until
     the specified size is reached. It ensures that all the required data is received
-    before returning.
+    before returning. The chunks are read directly into a preallocated buffer,
+    so receiving large messages costs no intermediate copies.
 
     If the received data size is less than the specified size, a `RuntimeError`
     is raised indicating the failure to receive the complete data.
     """
-    data = b""
-    while len(data) < size:
-        s = sock.recv(size - len(data))
-        data += s
-        if not s:
+    data = bytearray(size)
+    view = memoryview(data)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:])
+        if not n:
             raise RuntimeError(
-                f"did not receive data from socket (size {size}, got only {data!r})"
+                f"did not receive data from socket (size {size}, "
+                f"got only {bytes(data[:pos])!r})"
             )
+        pos += n
     return data
 
 
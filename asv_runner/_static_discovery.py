@@ -0,0 +1,439 @@
+"""
+Static discovery of benchmark modules.
+
+Builds a stand-in for a benchmark module from its syntax tree, without running
+the code of the module: only the function and class definitions, the literal
+assignments and the decorators of `asv_runner.benchmarks.mark` are executed.
+The stand-in is then searched for benchmarks exactly as an imported module, so
+that its listing is identical. Modules whose benchmarks depend on anything
+that cannot be resolved statically are rejected, and have to be imported.
+"""
+
+import ast
+import builtins
+import types
+
+from .benchmarks import benchmark_types, mark
+
+# Attributes read from the functions, classes and modules a benchmark is made
+# of; `setup` and `teardown` are looked up ignoring case, so all names are
+# compared in lower case
+BENCHMARK_ATTRIBUTES = frozenset(
+    [
+        "benchmark_name",
+        "ci_precision",
+        "env",
+        "min_run_count",
+        "number",
+        "param_names",
+        "params",
+        "pretty_name",
+        "pretty_source",
+        "processes",
+        "repeat",
+        "rounds",
+        "sample_time",
+        "setup",
+        "setup_cache",
+        "skip_benchmark",
+        "skip_params",
+        "skip_predicates",
+        "teardown",
+        "timeout",
+        "timer",
+        "type",
+        "unit",
+        "version",
+        "warmup_time",
+    ]
+)
+
+# Special methods that change how classes are instantiated, searched or set up
+_DYNAMIC_METHODS = frozenset(
+    [
+        "__init__",
+        "__new__",
+        "__getattr__",
+        "__getattribute__",
+        "__dir__",
+        "__init_subclass__",
+    ]
+)
+
+# Module or class level calls that can define names behind the back of the parser
+_DYNAMIC_CALLS = frozenset(
+    ["setattr", "exec", "eval", "globals", "vars", "locals", "__import__"]
+)
+
+_MARK_MODULE = mark.__name__
+
+
+class NotStatic(Exception):
+    """Raised when a module cannot be resolved statically."""
+
+
+def _matters(name):
+    """Whether a name, bound at module or class level, may define a benchmark
+    or one of its attributes."""
+    if name.lower() in BENCHMARK_ATTRIBUTES:
+        return True
+    return any(cls.name_regex.match(name) for cls in benchmark_types)
+
+
+def _bound_names(node, attributes=True):
+    """
+    Yields the names a statement binds in its own scope, and the attributes it
+    assigns unless `attributes` is false.
+    """
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        yield node.name
+        return
+    if isinstance(node, (ast.Lambda, ast.comprehension)):
+        return
+    if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+        yield node.id
+    elif (
+        attributes
+        and isinstance(node, ast.Attribute)
+        and isinstance(node.ctx, (ast.Store, ast.Del))
+    ):
+        yield node.attr
+    elif isinstance(node, ast.alias):
+        yield (node.asname or node.name).split(".")[0]
+    for child in ast.iter_child_nodes(node):
+        yield from _bound_names(child, attributes)
+
+
+def _check_dynamic_calls(node):
+    """Rejects a statement that calls one of `_DYNAMIC_CALLS`."""
+    for child in ast.walk(node):
+        if (
+            isinstance(child, ast.Call)
+            and isinstance(child.func, ast.Name)
+            and child.func.id in _DYNAMIC_CALLS
+        ):
+            raise NotStatic(f"line {node.lineno}: {child.func.id}()")
+
+
+def _check_unused(node):
+    """
+    Rejects a statement that is left out of the stand-in module if it binds a
+    name or assigns an attribute that matters.
+    """
+    for name in _bound_names(node):
+        if _matters(name):
+            raise NotStatic(f"line {node.lineno}: {name!r} is not static")
+
+
+class _ModuleBuilder:
+    """
+    Translates the syntax tree of a benchmark module into the statements that
+    are run to build its stand-in.
+
+    #### Parameters
+    **root_name** (`str`)
+    : The name of the benchmark suite package, to tell imports from inside the
+    suite apart.
+
+    #### Attributes
+    **namespace** (`dict`)
+    : Objects the stand-in needs besides its own definitions: the `mark`
+    module and its functions, under the names the module imports them as.
+
+    **static_names** (`set`)
+    : Module-level names bound to literal values.
+
+    **definitions** (`set`)
+    : Module-level names bound to functions and classes of the stand-in.
+    """
+
+    def __init__(self, root_name):
+        self.root_name = root_name
+        self.namespace = {}
+        self.mark_names = set()
+        self.static_names = set()
+        self.definitions = set()
+
+    def is_static(self, node, names):
+        """Whether an expression is a literal, possibly referring to the names
+        bound to literals in `names`."""
+        if isinstance(node, ast.Name):
+            return node.id in names
+        if isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+            return all(self.is_static(elt, names) for elt in node.elts)
+        if isinstance(node, ast.Dict):
+            return all(
+                key is not None and self.is_static(key, names) for key in node.keys
+            ) and all(self.is_static(value, names) for value in node.values)
+        try:
+            ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+            return False
+        return True
+
+    def is_mark(self, node):
+        """Whether an expression is `mark`, one of its functions, or a call of
+        one with literal arguments."""
+        if isinstance(node, ast.Call):
+            return (
+                self.is_mark(node.func)
+                and all(self.is_static(arg, self.static_names) for arg in node.args)
+                and all(
+                    kw.arg is not None and self.is_static(kw.value, self.static_names)
+                    for kw in node.keywords
+                )
+            )
+        if isinstance(node, ast.Attribute):
+            return self.is_mark(node.value)
+        return isinstance(node, ast.Name) and node.id in self.mark_names
+
+    def add_import(self, node):
+        """Records the imports of `mark`, and rejects imports from the suite
+        that may bring benchmarks in."""
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == _MARK_MODULE and alias.asname:
+                    self.bind_mark(alias.asname, mark)
+                elif alias.name.split(".")[0] == "asv_runner" and not alias.asname:
+                    import asv_runner
+
+                    self.bind_mark("asv_runner", asv_runner)
+                else:
+                    _check_unused(_alias_node(node, alias))
+            return
+
+        module = node.module or ""
+        internal = node.level > 0 or module.split(".")[0] == self.root_name
+        for alias in node.names:
+            name = alias.asname or alias.name
+            if alias.name == "*":
+                raise NotStatic(f"line {node.lineno}: star import")
+            if node.level == 0 and module == _MARK_MODULE:
+                self.bind_mark(name, getattr(mark, alias.name))
+            elif node.level == 0 and module + "." + alias.name == _MARK_MODULE:
+                self.bind_mark(name, mark)
+            elif internal and name[:1].isupper():
+                # May be a class holding benchmarks
+                raise NotStatic(f"line {node.lineno}: {name!r} is imported")
+            else:
+                _check_unused(_alias_node(node, alias))
+
+    def bind_mark(self, name, value):
+        self.namespace[name] = value
+        self.mark_names.add(name)
+
+    def function(self, node, names):
+        """
+        Returns a function definition, changed in place so that its defaults
+        are literals and it has no annotations nor body, or None if it is
+        irrelevant.
+        """
+        if not all(self.is_mark(decorator) for decorator in node.decorator_list):
+            _check_unused(node)
+            return None
+        args = node.args
+        # Defaults only matter to `check`; keep their number, not their value
+        args.defaults = [self.literal_or_none(d, names) for d in args.defaults]
+        args.kw_defaults = [
+            None if d is None else self.literal_or_none(d, names)
+            for d in args.kw_defaults
+        ]
+        for arg in (
+            getattr(args, "posonlyargs", [])
+            + args.args
+            + args.kwonlyargs
+            + [args.vararg, args.kwarg]
+        ):
+            if arg is not None:
+                arg.annotation = None
+        node.returns = None
+        # The stand-in is never called, and the source code of benchmarks is
+        # read from the file: keep only the docstring, saving on compilation
+        if not _is_docstring(node.body[0]):
+            node.body = [ast.copy_location(ast.Pass(), node.body[0])]
+        else:
+            del node.body[1:]
+        return node
+
+    def literal_or_none(self, node, names):
+        if self.is_static(node, names):
+            return node
+        return ast.copy_location(ast.Constant(value=None), node)
+
+    def class_(self, node):
+        """Returns a class definition, reduced in place to its methods and
+        literal attributes."""
+        if not all(self.is_mark(decorator) for decorator in node.decorator_list):
+            raise NotStatic(f"line {node.lineno}: class {node.name!r} is decorated")
+        if node.keywords:
+            raise NotStatic(f"line {node.lineno}: class {node.name!r} has keywords")
+        for base in node.bases:
+            if not (
+                isinstance(base, ast.Name)
+                and (base.id in self.definitions or hasattr(builtins, base.id))
+            ):
+                raise NotStatic(f"line {node.lineno}: unknown base of {node.name!r}")
+
+        names = set(self.static_names)
+        body = []
+        for stmt in node.body:
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if stmt.name in _DYNAMIC_METHODS:
+                    raise NotStatic(f"line {stmt.lineno}: {stmt.name} is defined")
+                stmt = self.function(stmt, names)
+            elif _is_docstring(stmt) or isinstance(stmt, ast.Pass):
+                pass
+            else:
+                _check_dynamic_calls(stmt)
+                new = self.assignment(stmt, names)
+                if new is None:
+                    names.difference_update(_bound_names(stmt, attributes=False))
+                stmt = new
+            if stmt is not None:
+                body.append(stmt)
+
+        node.body = body or [ast.copy_location(ast.Pass(), node)]
+        return node
+
+    def assignment(self, node, names):
+        """
+        Returns an assignment of literals to names, or to attributes of the
+        definitions of the module, as an `ast.Assign`; None for other
+        statements, which are left out.
+        """
+        if isinstance(node, ast.AnnAssign):
+            if node.value is None:
+                return None
+            node = ast.copy_location(
+                ast.Assign(targets=[node.target], value=node.value), node
+            )
+        if not isinstance(node, ast.Assign):
+            _check_unused(node)
+            return None
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                continue
+            if (
+                isinstance(target, ast.Attribute)
+                and isinstance(target.value, ast.Name)
+                and target.value.id in self.definitions
+            ):
+                continue
+            _check_unused(node)
+            return None
+        if not self.is_static(node.value, names):
+            _check_unused(node)
+            return None
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                names.add(target.id)
+        return node
+
+    def forget(self, node):
+        """Forgets what is known of the names a statement rebinds."""
+        names = set(_bound_names(node, attributes=False))
+        self.static_names -= names
+        self.definitions -= names
+        self.mark_names -= names
+
+    def module(self, tree):
+        """Returns the statements of the stand-in module."""
+        body = []
+        for stmt in tree.body:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+                self.forget(stmt)
+                self.add_import(stmt)
+                continue
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if stmt.name in _DYNAMIC_METHODS:
+                    raise NotStatic(f"line {stmt.lineno}: {stmt.name} is defined")
+                new = self.function(stmt, self.static_names)
+                if new is not None:
+                    self.definitions.add(stmt.name)
+                else:
+                    self.definitions.discard(stmt.name)
+                self.static_names.discard(stmt.name)
+            elif isinstance(stmt, ast.ClassDef):
+                new = self.class_(stmt)
+                self.definitions.add(stmt.name)
+                self.static_names.discard(stmt.name)
+            elif _is_docstring(stmt):
+                new = stmt
+            else:
+                _check_dynamic_calls(stmt)
+                self.forget(stmt)
+                new = self.assignment(stmt, self.static_names)
+            if new is not None:
+                body.append(new)
+        return body
+
+
+def _alias_node(node, alias):
+    """An import statement binding a single alias, for `_check_unused`."""
+    return ast.copy_location(type(node)(names=[alias]), node)
+
+
+def _is_docstring(node):
+    return (
+        isinstance(node, ast.Expr)
+        and isinstance(node.value, ast.Constant)
+        and isinstance(node.value.value, str)
+    )
+
+
+def load_static_module(module_name, path, root_name):
+    """
+    Builds a stand-in for a benchmark module without importing it.
+
+    #### Parameters
+    **module_name** (`str`)
+    : The fully-qualified name of the module.
+
+    **path** (`str`)
+    : The source file of the module.
+
+    **root_name** (`str`)
+    : The name of the benchmark suite package.
+
+    #### Returns
+    **module** (module or None)
+    : A module holding the benchmark functions and classes, their literal
+    attributes and the module-level literals, or None if the benchmarks of the
+    module may depend on code that would have to run.
+
+    #### Notes
+    The stand-in functions are compiled from the original file, so that their
+    source code, line numbers and thus the benchmark versions and setup cache
+    keys are those of the imported module. Default argument values that are
+    not literals are replaced by None, and annotations are dropped.
+
+    Names imported from outside of the suite are assumed not to be benchmarks:
+    a class imported from another package is not searched for benchmark
+    methods. Besides, benchmark types provided by plugins that read
+    attributes other than `BENCHMARK_ATTRIBUTES` are not supported.
+    """
+    if not path.endswith(".py"):
+        return None
+    try:
+        with open(path, "rb") as fp:
+            tree = ast.parse(fp.read(), filename=path)
+        builder = _ModuleBuilder(root_name)
+        body = builder.module(tree)
+    except (NotStatic, SyntaxError, ValueError):
+        return None
+
+    module = types.ModuleType(module_name)
+    module.__file__ = path
+    if path.endswith("__init__.py"):
+        module.__package__ = module_name
+    else:
+        module.__package__ = module_name.rpartition(".")[0]
+    module.__dict__.update(builder.namespace)
+    # New nodes are given locations as they are made, which is much cheaper
+    # than `ast.fix_missing_locations`
+    code = compile(ast.Module(body=body, type_ignores=[]), path, "exec")
+    try:
+        exec(code, module.__dict__)
+    except Exception:
+        return None
+    return module
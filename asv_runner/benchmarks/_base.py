@@ -1,12 +1,15 @@
 import cProfile as profile
+import functools
 import inspect
 import io
 import itertools
 import math
+import operator
 import os
 import re
 import textwrap
 import tokenize
+import weakref
 from collections import Counter
 from hashlib import sha256
 
@@ -48,6 +51,43 @@ def code_fingerprint(code):
     return _token_fingerprint(code)
 
 
+# Memo of `inspect.getsourcelines` and file modification time, by code object.
+# Weak, so that it does not keep alive the code of reloaded or discarded modules
+_source_lines_memo = weakref.WeakKeyDictionary()
+
+
+def _getsourcelines(obj):
+    """
+    `inspect.getsourcelines`, memoized for functions and methods.
+
+    #### Notes
+    The methods of a benchmark class share their `setup` and `setup_cache`,
+    whose source would otherwise be extracted again for every benchmark. The
+    memo is keyed by code object, and holds the modification time of its file,
+    so that a file edited without changing the code (comments) is read again.
+    """
+    func = inspect.unwrap(obj)
+    func = inspect.unwrap(getattr(func, "__func__", func))
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return inspect.getsourcelines(obj)
+    try:
+        mtime = os.stat(code.co_filename).st_mtime_ns
+    except OSError:
+        mtime = None
+    memo_mtime, result = _source_lines_memo.get(code, (None, None))
+    if result is None or memo_mtime != mtime:
+        result = inspect.getsourcelines(obj)
+        _source_lines_memo[code] = (mtime, result)
+    return result
+
+
+@functools.lru_cache(maxsize=256)
+def _memo_fingerprint(code):
+    """`code_fingerprint`, memoized."""
+    return code_fingerprint(code)
+
+
 def _get_attr(source, name, ignore_case=False):
     """
     Retrieves an attribute from a source by its name.
@@ -82,6 +122,33 @@ def _get_attr(source, name, ignore_case=False):
         return None
 
 
+def _folded_attr_names(source):
+    """
+    Returns the attribute names of a source by case-folded name.
+
+    #### Parameters
+    **source** (`object`)
+    : The source of the attributes.
+
+    #### Returns
+    **names** (`dict`)
+    : The names in `dir(source)`, keyed by their lowercase form.
+
+    **ambiguous** (`set`)
+    : The lowercase forms shared by several names.
+    """
+    keys = dir(source)
+    names = dict(zip(map(str.lower, keys), keys))
+    ambiguous = set()
+    if len(names) < len(keys):
+        seen = set()
+        for key in map(str.lower, keys):
+            if key in seen:
+                ambiguous.add(key)
+            seen.add(key)
+    return names, ambiguous
+
+
 def _get_all_attrs(sources, name, ignore_case=False):
     """
     Yields attributes from a list of sources by their name.
@@ -156,7 +223,7 @@ def get_setup_cache_key(func):
     if not mname:
         mname = inspect.getsourcefile(func)
 
-    return f"{mname}:{inspect.getsourcelines(func)[1]}"
+    return f"{mname}:{_getsourcelines(func)[1]}"
 
 
 def get_source_code(items):
@@ -194,7 +261,7 @@ def get_source_code(items):
         # original source
         else:
             try:
-                lines, _ = inspect.getsourcelines(func)
+                lines, _ = _getsourcelines(func)
             except TypeError:
                 continue
 
@@ -252,7 +319,7 @@ def _get_sourceline_info(obj, basedir):
     try:
         fn = inspect.getsourcefile(obj)
         fn = os.path.relpath(fn, basedir)
-        _, lineno = inspect.getsourcelines(obj)
+        _, lineno = _getsourcelines(obj)
         return f" in {fn!s}:{lineno!s}"
     except Exception:
         return ""
@@ -375,6 +442,32 @@ def _repr_no_address(obj):
     return result
 
 
+def _compile_skip_tuples(skip_tuples):
+    """
+    Splits the `skip_params` of a benchmark into a set, for the parameter sets
+    that can be hashed, and a list of the others.
+
+    #### Parameters
+    **skip_tuples** (`list`)
+    : The parameter sets to skip.
+
+    #### Returns
+    **hashable** (`frozenset`)
+    : The parameter sets that can be hashed.
+
+    **unhashable** (`list`)
+    : The other parameter sets, compared one by one.
+    """
+    hashable = set()
+    unhashable = []
+    for skip in skip_tuples:
+        try:
+            hashable.add(skip)
+        except TypeError:
+            unhashable.append(skip)
+    return frozenset(hashable), unhashable
+
+
 def _validate_params(params, param_names, name):
     """
     Validates the params and param_names attributes and returns validated lists.
@@ -446,6 +539,51 @@ def _unique_param_ids(params):
     return params
 
 
+# Placeholder of a `_LazyAttribute` that has not been computed yet
+_PENDING = object()
+
+# Largest number of parameter combinations whose skip predicates are evaluated
+# at discovery; beyond it `skipped_param_idx` is left to the run
+_SKIP_GRID_LIMIT = 100000
+
+
+class _LazyAttribute:
+    """
+    Benchmark attribute computed on first access.
+
+    #### Parameters
+    **fill** (`function`)
+    : Called with the benchmark to compute the attribute, which it assigns.
+
+    **listed** (`bool`, optional)
+    : Whether `list_benchmarks` reports the attribute. It is not computed for
+    the listing otherwise.
+
+    #### Notes
+    The benchmark holds `_PENDING` under the attribute name in its `__dict__`
+    until the attribute is computed, so that its attributes keep the order in
+    which they were declared. Assigning the attribute sets it as for a plain
+    attribute.
+    """
+
+    def __init__(self, fill, listed=True):
+        self.fill = fill
+        self.listed = listed
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if instance.__dict__.get(self.name, _PENDING) is _PENDING:
+            self.fill(instance)
+        return instance.__dict__[self.name]
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+
 class Benchmark:
     """
     Class representing a single benchmark. The class encapsulates
@@ -458,6 +596,11 @@ class Benchmark:
     benchmarking using various helper methods.
 
     By default, a benchmark's timeout is set to 60 seconds.
+
+    The `setup_cache_key`, `code`, `version`, `version_alts` and `params`
+    attributes are only computed when they are first read: running a
+    benchmark does not need its source code nor its version, which are costly
+    to extract and hash.
     """
 
     # The regex of the name of function or method to be considered as
@@ -494,7 +637,7 @@ class Benchmark:
         : A special setup method that is only run once per parameter set.
 
         **setup_cache_key** (`str`)
-        : A unique key for the setup cache.
+        : A unique key for the setup cache (lazy).
 
         **setup_cache_timeout** (`float`)
         : The time after which the setup cache should be invalidated.
@@ -503,10 +646,15 @@ class Benchmark:
         : The maximum time the benchmark is allowed to run before it is aborted.
 
         **code** (`str`)
-        : The source code of the function to be benchmarked and its setup methods.
+        : The source code of the function to be benchmarked and its setup methods
+        (lazy).
 
         **version** (`str`)
-        : A version string derived from a hash of the code.
+        : A version string derived from a hash of the code (lazy).
+
+        **version_alts** (`tuple`)
+        : Alternate versions the results of the benchmark are compatible with
+        (lazy).
 
         **_params** (`list`)
         : List of parameters for the function to be benchmarked.
@@ -519,12 +667,27 @@ class Benchmark:
         benchmark.
 
         **params** (`list`)
-        : The list of parameters with unique representations for exporting.
+        : The list of parameters with unique representations for exporting
+        (lazy).
 
         **_skip_tuples** (`list`)
         : List of tuples representing parameter combinations to be skipped
         before calling the setup method.
 
+        **_skip_predicates** (`list`)
+        : Functions called with the parameter values, that return whether to
+        skip them; see `skip_params_where`.
+
+        **skipped_param_idx** (`list` or None)
+        : The indices of the parameter combinations skipped by `_skip_tuples`
+        or `_skip_predicates`, or None if there are none or they are only
+        known when run: when a predicate fails, or would have to be evaluated
+        on more than `_SKIP_GRID_LIMIT` combinations (lazy).
+
+        **_attr_table** (`dict`)
+        : The attributes looked up in the attribute sources so far, by name;
+        see `_first_attr`.
+
         #### Raises
         **ValueError**
         : If `param_names` or `_params` is not a list or if the number of
@@ -534,34 +697,25 @@ class Benchmark:
         self.func = func
         self.pretty_name = getattr(func, "pretty_name", None)
         self._attr_sources = attr_sources
-        self._setups = list(_get_all_attrs(attr_sources, "setup", True))[::-1]
-        self._teardowns = list(_get_all_attrs(attr_sources, "teardown", True))
-        self._setup_cache = _get_first_attr(attr_sources, "setup_cache", None)
-        self.setup_cache_key = get_setup_cache_key(self._setup_cache)
+        self._invalidate_attrs()
+        self._setups = list(self._all_attrs_ignore_case("setup"))[::-1]
+        self._teardowns = list(self._all_attrs_ignore_case("teardown"))
+        self._setup_cache = self._first_attr("setup_cache", None)
+        self.setup_cache_key = _PENDING
         self.setup_cache_timeout = _get_first_attr([self._setup_cache], "timeout", None)
-        self.timeout = _get_first_attr(attr_sources, "timeout", None)
-        self.code = get_source_code([self.func] + self._setups + [self._setup_cache])
-        # Primary version: SHA-256 of source text (backwards compatible with asv
-        # tests and historical result keys). Token-stable fingerprint is an
-        # alternate identity for tooling/backfill (cosmetic edits share token hash).
-        code_text = self.code.encode("utf-8")
-        code_hash = sha256(code_text).hexdigest()
-        token_hash = code_fingerprint(self.code)
-        explicit_version = _get_first_attr(attr_sources, "version", None)
-        if explicit_version is not None:
-            self.version = str(explicit_version)
-            self.version_alts = ()
-        else:
-            self.version = code_hash
-            # Prefer unique alts only (token form when it differs from wire version)
-            self.version_alts = (token_hash,) if token_hash != code_hash else ()
+        self.timeout = self._first_attr("timeout", None)
+        self.code = _PENDING
+        # Read now: extra parameters may be added to the sources later
+        self._explicit_version = self._first_attr("version", None)
+        self.version = _PENDING
+        self.version_alts = _PENDING
         self.type = "base"
         self.unit = "unit"
 
         self._redo_setup_next = False
 
-        self._params = _get_first_attr(attr_sources, "params", [])
-        self.param_names = _get_first_attr(attr_sources, "param_names", [])
+        self._params = self._first_attr("params", [])
+        self.param_names = self._first_attr("param_names", [])
         self._current_params = ()
         self._current_cache = None
 
@@ -570,21 +724,271 @@ class Benchmark:
         )
 
         # Fetch skip parameters
-        self._skip_tuples = _get_first_attr(attr_sources, "skip_params", [])
+        self._skip_tuples = self._first_attr("skip_params", [])
+        self._skip_set, self._skip_unhashable = _compile_skip_tuples(self._skip_tuples)
+        self._skip_predicates = list(self._first_attr("skip_predicates", []))
+        self._skip_memo = (None, False)
 
         # Exported parameter representations
-        self.params = _unique_param_ids(self._params)
+        self.params = _PENDING
+        self.skipped_param_idx = _PENDING
 
     def __repr__(self):
         return f"<{self.__class__.__name__} {self.name}>"
 
+    def _first_attr(self, name, default):
+        """
+        Returns the first attribute of the attribute sources with a name, as
+        `_get_first_attr`.
+
+        #### Parameters
+        **name** (`str`)
+        : The name of the attribute.
+
+        **default** (`object`)
+        : The value returned if no source has the attribute.
+
+        #### Returns
+        **attr** (`object`)
+        : The first attribute found, or `default`.
+
+        #### Notes
+        Every name is looked up once in the sources and kept in `_attr_table`,
+        until `_invalidate_attrs` is called.
+        """
+        try:
+            value = self._attr_table[name]
+        except KeyError:
+            value = _get_first_attr(self._attr_sources, name, None)
+            self._attr_table[name] = value
+        return default if value is None else value
+
+    def _all_attrs_ignore_case(self, name):
+        """
+        Returns the attributes of the attribute sources whose name is `name`
+        ignoring case, as `_get_all_attrs` does with `ignore_case`.
+
+        #### Parameters
+        **name** (`str`)
+        : The name of the attribute.
+
+        #### Returns
+        **attrs** (`list`)
+        : The attributes found, in the order of the sources.
+
+        #### Raises
+        **ValueError**
+        : If a source has more than one attribute with the name.
+
+        #### Notes
+        The names of every source are listed and case-folded once, see
+        `_folded_attr_names`, instead of once per name looked up.
+        """
+        if self._folded_attr_names is None:
+            self._folded_attr_names = [
+                _folded_attr_names(source) for source in self._attr_sources
+            ]
+        folded = name.lower()
+        attrs = []
+        for source, (names, ambiguous) in zip(
+            self._attr_sources, self._folded_attr_names
+        ):
+            if folded in ambiguous:
+                raise ValueError(
+                    f"{source.__name__} contains multiple {name} functions."
+                )
+            if folded in names:
+                val = getattr(source, names[folded])
+                if val is not None:
+                    attrs.append(val)
+        return attrs
+
+    def _invalidate_attrs(self):
+        """
+        Forgets the attributes looked up so far. Called when the attribute
+        sources change, and after setup functions ran, as they may set
+        attributes.
+        """
+        self._attr_table = {}
+        self._folded_attr_names = None
+
+    def _fill_setup_cache_key(self):
+        self.setup_cache_key = get_setup_cache_key(self._setup_cache)
+
+    def _fill_code(self):
+        self.code = get_source_code([self.func] + self._setups + [self._setup_cache])
+
+    def _fill_version(self):
+        payload = self._version_payload()
+        if payload is None:
+            self.version = str(self._explicit_version)
+        else:
+            # Primary version: SHA-256 of source text (backwards compatible with
+            # asv tests and historical result keys).
+            self.version = sha256(payload.encode("utf-8")).hexdigest()
+
+    def _fill_version_alts(self):
+        # Token-stable fingerprint is an alternate identity for tooling/backfill
+        # (cosmetic edits share token hash). Prefer unique alts only (token form
+        # when it differs from wire version).
+        payload = self._version_payload()
+        if payload is None:
+            self.version_alts = ()
+            return
+        code_hash = sha256(payload.encode("utf-8")).hexdigest()
+        token_hash = _memo_fingerprint(payload)
+        self.version_alts = (token_hash,) if token_hash != code_hash else ()
+
+    def _fill_params(self):
+        self.params = _unique_param_ids(self._params)
+
+    def _fill_skipped_param_idx(self):
+        self.skipped_param_idx = None
+        if not (self._skip_tuples or self._skip_predicates):
+            return
+        try:
+            if self._skip_predicates:
+                size = 1
+                for param in self._params:
+                    size *= len(param)
+                if size > _SKIP_GRID_LIMIT:
+                    return
+                skipped = [
+                    param_idx
+                    for param_idx, param_tuple in enumerate(
+                        itertools.product(*self._params)
+                    )
+                    if self._skips(param_tuple)
+                ]
+            else:
+                skipped = self._skip_tuple_indices()
+        except Exception:
+            # Left to the run of the failing parameters, which reports it
+            return
+        self.skipped_param_idx = skipped or None
+
+    def _skip_tuple_indices(self):
+        """
+        Returns the sorted indices of the parameter combinations in
+        `_skip_tuples`, without walking the Cartesian product of the parameters.
+
+        #### Notes
+        Each skip tuple is decoded as by `get_param_idx`, taking every
+        position of a value repeated in its parameter list. Entries that are
+        not parameter combinations of the benchmark skip nothing.
+        """
+        skipped = set()
+        for skip in self._skip_tuples:
+            if not isinstance(skip, tuple) or len(skip) != len(self._params):
+                continue
+            positions = [
+                [pos for pos, value in enumerate(param) if value is v or value == v]
+                for param, v in zip(self._params, skip)
+            ]
+            for digits in itertools.product(*positions):
+                param_idx = 0
+                for param, pos in zip(self._params, digits):
+                    param_idx = param_idx * len(param) + pos
+                skipped.add(param_idx)
+        return sorted(skipped)
+
+    setup_cache_key = _LazyAttribute(_fill_setup_cache_key)
+    code = _LazyAttribute(_fill_code)
+    version = _LazyAttribute(_fill_version)
+    version_alts = _LazyAttribute(_fill_version_alts, listed=False)
+    params = _LazyAttribute(_fill_params)
+    skipped_param_idx = _LazyAttribute(_fill_skipped_param_idx)
+
+    def _version_payload(self):
+        """
+        Returns the text the version of the benchmark is a hash of: its code, or
+        None if the benchmark has an explicit `version` attribute.
+        """
+        if self._explicit_version is not None:
+            return None
+        return self.code
+
+    def get_param_tuple(self, param_idx):
+        """
+        Returns the parameter values at an index of the Cartesian product of
+        the parameters.
+
+        #### Parameters
+        **param_idx** (`int`)
+        : The index of the parameter set in the Cartesian product of the
+        `_params` attribute list, in the order of `itertools.product`.
+
+        #### Returns
+        **param_tuple** (`tuple`)
+        : The parameter values, one per parameter.
+
+        #### Raises
+        **ValueError**
+        : If the index is not an integer or is out of range.
+
+        #### Notes
+        The index is decoded as a mixed-radix number whose digits are the
+        positions of the values in each parameter list, the last parameter
+        varying fastest. This takes a step per parameter instead of walking
+        the Cartesian product up to the index.
+        """
+        try:
+            param_idx = operator.index(param_idx)
+        except TypeError:
+            raise ValueError(
+                f"Invalid benchmark parameter permutation index: {param_idx!r}"
+            )
+        rest = param_idx
+        values = []
+        for param in reversed(self._params):
+            if not param or rest < 0:
+                break
+            rest, pos = divmod(rest, len(param))
+            values.append(param[pos])
+        else:
+            if rest == 0:
+                return tuple(reversed(values))
+        raise ValueError(
+            f"Invalid benchmark parameter permutation index: {param_idx!r}"
+        )
+
+    def get_param_idx(self, param_tuple):
+        """
+        Returns the index of parameter values in the Cartesian product of the
+        parameters; the inverse of `get_param_tuple`.
+
+        #### Parameters
+        **param_tuple** (`tuple`)
+        : The parameter values, one per parameter.
+
+        #### Returns
+        **param_idx** (`int`)
+        : The index of the first parameter set equal to `param_tuple`.
+
+        #### Raises
+        **ValueError**
+        : If `param_tuple` is not a parameter set of the benchmark.
+        """
+        param_tuple = tuple(param_tuple)
+        if len(param_tuple) != len(self._params):
+            raise ValueError(f"Invalid benchmark parameter set: {param_tuple!r}")
+        param_idx = 0
+        for param, value in zip(self._params, param_tuple):
+            try:
+                pos = param.index(value)
+            except ValueError:
+                raise ValueError(f"Invalid benchmark parameter set: {param_tuple!r}")
+            param_idx = param_idx * len(param) + pos
+        return param_idx
+
     def set_param_idx(self, param_idx):
         """
         Set the current parameter values for the benchmark based on a parameter
         index.
 
         This method updates the `_current_params` attribute with the set of
-        parameter values that correspond to the provided parameter index.
+        parameter values that correspond to the provided parameter index; see
+        `get_param_tuple`.
 
         #### Parameters
         **param_idx** (`int`)
@@ -597,14 +1001,47 @@ class Benchmark:
         index does not correspond to any element in the Cartesian product of the
         `_params` list.
         """
+        self._current_params = self.get_param_tuple(param_idx)
+
+    def _skips(self, param_tuple):
+        """
+        Whether a parameter set is skipped, by `skip_params` or by one of the
+        `skip_predicates`.
+
+        #### Parameters
+        **param_tuple** (`tuple`)
+        : The parameter values.
+
+        #### Returns
+        **skipped** (`bool`)
+        : True if the parameter set is skipped.
+
+        #### Notes
+        `skip_params` are looked up in a set, and only compared one by one when
+        they, or the parameter values, cannot be hashed.
+        """
         try:
-            (self._current_params,) = itertools.islice(
-                itertools.product(*self._params), param_idx, param_idx + 1
-            )
-        except ValueError:
-            raise ValueError(
-                f"Invalid benchmark parameter permutation index: {param_idx!r}"
-            )
+            if param_tuple in self._skip_set:
+                return True
+        except TypeError:
+            if param_tuple in self._skip_tuples:
+                return True
+        else:
+            if self._skip_unhashable and param_tuple in self._skip_unhashable:
+                return True
+        return any(predicate(*param_tuple) for predicate in self._skip_predicates)
+
+    def _is_skipped(self):
+        """
+        Whether the current parameters are skipped, see `_skips`. The answer is
+        kept until the current parameters are replaced.
+        """
+        params, skipped = self._skip_memo
+        if params is not self._current_params:
+            params = self._current_params
+            skipped = self._skips(tuple(params))
+            self._skip_memo = (params, skipped)
+        return skipped
 
     def set_cache(self, cache):
         """
@@ -711,7 +1148,7 @@ class Benchmark:
         return ok
 
     def do_setup(self):
-        if tuple(self._current_params) in self._skip_tuples:
+        if self._is_skipped():
             # Skip
             return True
         try:
@@ -731,7 +1168,7 @@ class Benchmark:
         self.do_setup()
 
     def do_teardown(self):
-        if tuple(self._current_params) in self._skip_tuples:
+        if self._is_skipped():
             # Skip
             return
         for teardown in self._teardowns:
@@ -748,7 +1185,7 @@ class Benchmark:
             return self._setup_cache()
 
     def do_run(self):
-        if tuple(self._current_params) in self._skip_tuples:
+        if self._is_skipped():
             # Skip
             return
         return self.run(*self._build_params())
@@ -775,7 +1212,7 @@ class Benchmark:
         raised. If a `filename` is provided, the profiling results will be saved
         to that file.
         """
-        if tuple(self._current_params) in self._skip_tuples:
+        if self._is_skipped():
             # Skip
             return
 
@@ -205,6 +205,52 @@ def skip_params_if(skip_params_list, condition):
     return decorator
 
 
+def skip_params_where(predicate):
+    """
+    Decorator to skip the parameter combinations of a benchmark function for
+    which a predicate is true.
+
+    #### Parameters
+    **predicate** (`callable`):
+    A function called with the parameter values of a combination, as the
+    benchmark function is, that returns whether to skip it.
+
+    #### Returns
+    **decorator** (`function`):
+    A decorator function that adds the predicate to the `skip_predicates` of
+    the benchmark function.
+
+    #### Notes
+    The predicates are evaluated during discovery, so that the listing of the
+    benchmark holds the indices of the skipped combinations in
+    `skipped_param_idx`, and again before a combination is set up. As with
+    `skip_for_params`, skipped combinations are not set up nor run. Stacked
+    decorators add their predicates to each other.
+
+    #### Example
+    ```{code-block} python
+    class Sizes:
+        params = ([10, 1000, 100000], ["list", "set"])
+        param_names = ["n", "container"]
+
+        @skip_params_where(lambda n, container: n > 1000 and container == "list")
+        def time_contains(self, n, container):
+            pass
+    ```
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+
+        predicates = list(getattr(func, "skip_predicates", [])) + [predicate]
+        setattr(wrapper, "skip_predicates", predicates)
+        return wrapper
+
+    return decorator
+
+
 def parameterize_class_with(param_dict):
     """
     Class Decorator to set benchmark parameters for a class.
@@ -431,6 +477,7 @@ _BENCHMARK_ATTRS = frozenset(
         "sample_time",
         "number",
         "repeat",
+        "ci_precision",
         "rounds",
         "min_run_count",
         "processes",
@@ -438,6 +485,7 @@ _BENCHMARK_ATTRS = frozenset(
         "params",
         "param_names",
         "skip_params",
+        "skip_predicates",
         "skip_benchmark",
         "setup_cache_timeout",
         "goal_time",
@@ -515,5 +563,6 @@ __all__ = [
     "skip_benchmark_if",
     "skip_for_params",
     "skip_params_if",
+    "skip_params_where",
     "timeout_at",
 ]
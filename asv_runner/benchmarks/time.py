@@ -1,11 +1,34 @@
+import bisect
 import re
 import sys
 import timeit
 
-from ._base import Benchmark, _get_first_attr
+from ..statistics import sorted_quantile_ci
+from ._base import Benchmark
 
 wall_timer = timeit.default_timer
 
+# Called as `callback(timing, number)` for every sample `benchmark_timing`
+# collects, see `set_sample_callback`
+_sample_callback = None
+
+
+def set_sample_callback(callback):
+    """
+    Sets a function called with every timing sample as soon as it is taken.
+
+    #### Parameters
+    **callback** (`callable` or None)
+    : Called as `callback(timing, number)`, where `timing` is the total time
+    of `number` executions of the benchmark, or None to remove it.
+
+    #### Notes
+    The fork server uses this to keep the samples of a benchmark child outside
+    of it, so that they survive the child being killed on timeout.
+    """
+    global _sample_callback
+    _sample_callback = callback
+
 
 class TimeBenchmark(Benchmark):
     """
@@ -38,10 +61,18 @@ class TimeBenchmark(Benchmark):
 
     **timer** (`callable`)
     : The timer to use, by default it uses `timeit.default_timer`.
+
+    **ci_precision** (`float`)
+    : Target relative half-width of the 99% confidence interval of the median
+    sample. When nonzero, sampling stops as soon as it is reached, between the
+    minimum and maximum repeat counts. Defaults to 0, which disables it.
     """
 
     name_regex = re.compile("^(Time[A-Z_].+)|(time_.+)$")
 
+    # Only set on the instance when nonzero, so that it is not listed otherwise
+    ci_precision = 0.0
+
     def __init__(self, name, func, attr_sources):
         """
         Initialize a new instance of `TimeBenchmark`.
@@ -60,25 +91,30 @@ class TimeBenchmark(Benchmark):
         self.type = "time"
         self.unit = "seconds"
         self._attr_sources = attr_sources
-        old = int(
-            _get_first_attr(self._attr_sources, "processes", 2)
-        )  # backward compat.
-        self.rounds = int(_get_first_attr(self._attr_sources, "rounds", old))
+        old = int(self._first_attr("processes", 2))  # backward compat.
+        self.rounds = int(self._first_attr("rounds", old))
         self._load_vars()
 
     def _load_vars(self):
         """Loads benchmark variables from attribute sources."""
-        self.repeat = _get_first_attr(self._attr_sources, "repeat", 0)
-        self.min_run_count = _get_first_attr(self._attr_sources, "min_run_count", 2)
-        self.number = int(_get_first_attr(self._attr_sources, "number", 0))
-        self.sample_time = _get_first_attr(self._attr_sources, "sample_time", 0.01)
-        self.warmup_time = _get_first_attr(self._attr_sources, "warmup_time", -1)
-        self.timer = _get_first_attr(self._attr_sources, "timer", wall_timer)
+        self.repeat = self._first_attr("repeat", 0)
+        self.min_run_count = self._first_attr("min_run_count", 2)
+        self.number = int(self._first_attr("number", 0))
+        self.sample_time = self._first_attr("sample_time", 0.01)
+        self.warmup_time = self._first_attr("warmup_time", -1)
+        self.timer = self._first_attr("timer", wall_timer)
+        ci_precision = float(self._first_attr("ci_precision", 0))
+        if ci_precision:
+            self.ci_precision = ci_precision
+        else:
+            self.__dict__.pop("ci_precision", None)
 
     def do_setup(self):
         """Execute the setup method and load variables."""
         result = Benchmark.do_setup(self)
         # For parameterized tests, setup() is allowed to change these
+        if self._setups:
+            self._invalidate_attrs()
         self._load_vars()
         return result
 
@@ -121,7 +157,8 @@ class TimeBenchmark(Benchmark):
         timing. It can be an integer, meaning the function is run that many
         times, or a tuple of three values, specifying the minimum number of
         runs, the maximum number of runs, and the maximum total time to spend on
-        runs.
+        runs. With a `ci_precision` and the default `repeat`, the maximum number
+        of runs is raised to 50, since sampling then usually stops well before.
 
         After obtaining the timing samples, each sample is divided by the
         `number` of function executions to get the average time per function
@@ -146,6 +183,8 @@ class TimeBenchmark(Benchmark):
                 min_repeat = 1
                 max_repeat = 10
                 max_time = 20.0
+                if self.ci_precision > 0:
+                    max_repeat = 50
                 if self.rounds > 1:
                     max_repeat //= 2
                     max_time /= 2.0
@@ -170,6 +209,7 @@ class TimeBenchmark(Benchmark):
             warmup_time=warmup_time,
             number=self.number,
             min_run_count=self.min_run_count,
+            ci_precision=self.ci_precision,
         )
 
         samples = [s / number for s in samples]
@@ -184,6 +224,7 @@ class TimeBenchmark(Benchmark):
         warmup_time,
         number,
         min_run_count,
+        ci_precision=0.0,
     ):
         """
         Benchmark the timing of the function execution.
@@ -210,6 +251,11 @@ class TimeBenchmark(Benchmark):
         **min_run_count** (`int`)
         : The minimum number of runs required for the benchmark.
 
+        **ci_precision** (`float`, optional)
+        : Target relative half-width of the 99% confidence interval of the
+        median sample, at which sampling stops. Defaults to 0, which disables
+        this stopping rule.
+
         #### Returns
         **result** (`tuple`)
         : A tuple with the samples taken and the number of times the function
@@ -229,13 +275,28 @@ class TimeBenchmark(Benchmark):
 
         After these initial steps, the function execution times are sampled and
         added to the `samples` list, stopping when reaching the maximum repeat
-        count or when the `too_slow` function indicates to stop.
+        count or when the `too_slow` function indicates to stop. Each sample is
+        also passed to the callback set with `set_sample_callback`, if any.
+
+        With a nonzero `ci_precision`, the samples are also kept sorted as they
+        come in, and sampling stops once the minimum repeat and run counts are
+        met and the confidence interval of the median, as reported by
+        `compute_stats`, is within `ci_precision` of it on each side on
+        average. The interval is only finite from 8 samples on.
         """
         sample_time = self.sample_time
         start_time = wall_timer()
         run_count = 0
 
         samples = []
+        ordered = []
+
+        def precise_enough():
+            # stop taking samples once the median is known well enough
+            if run_count < min_run_count or len(ordered) < min_repeat:
+                return False
+            m, (a, b) = sorted_quantile_ci(ordered, 0.5, alpha_min=0.01)
+            return m > 0 and b - a <= 2 * ci_precision * m
 
         def too_slow(num_samples):
             # stop taking samples if limits exceeded
@@ -289,10 +350,17 @@ class TimeBenchmark(Benchmark):
             timing = timer.timeit(number)
             run_count += number
             samples.append(timing)
+            if _sample_callback is not None:
+                _sample_callback(timing, number)
 
             if too_slow(len(samples)):
                 break
 
+            if ci_precision > 0:
+                bisect.insort(ordered, timing)
+                if precise_enough():
+                    break
+
         return samples, number
 
 
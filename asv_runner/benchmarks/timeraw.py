@@ -3,9 +3,7 @@ import re
 import subprocess
 import sys
 import textwrap
-from hashlib import sha256
 
-from ._base import _get_first_attr, code_fingerprint
 from .time import TimeBenchmark
 
 
@@ -139,23 +137,20 @@ class TimerawBenchmark(TimeBenchmark):
 
     def __init__(self, name, func, attr_sources):
         TimeBenchmark.__init__(self, name, func, attr_sources)
-        explicit_version = _get_first_attr(attr_sources, "version", None)
-        if explicit_version is None:
-            env_fp = _env_fingerprint(
-                _normalize_timeraw_env(_get_first_attr(attr_sources, "env", None))
-            )
-            if env_fp:
-                payload = self.code + "\n# timeraw_env\n" + env_fp
-                self.version = sha256(payload.encode("utf-8")).hexdigest()
-                token = code_fingerprint(payload)
-                self.version_alts = (token,) if token != self.version else ()
+        self._env_fingerprint = _env_fingerprint(
+            _normalize_timeraw_env(self._first_attr("env", None))
+        )
+
+    def _version_payload(self):
+        payload = TimeBenchmark._version_payload(self)
+        if payload is not None and self._env_fingerprint:
+            payload += "\n# timeraw_env\n" + self._env_fingerprint
+        return payload
 
     def _load_vars(self):
         TimeBenchmark._load_vars(self)
-        self.number = int(_get_first_attr(self._attr_sources, "number", 1))
-        self._timeraw_env = _normalize_timeraw_env(
-            _get_first_attr(self._attr_sources, "env", None)
-        )
+        self.number = int(self._first_attr("number", 1))
+        self._timeraw_env = _normalize_timeraw_env(self._first_attr("env", None))
         del self.timer
 
     def _get_timer(self, *param):
@@ -1,6 +1,6 @@
 import re
 
-from ._base import Benchmark, _get_first_attr
+from ._base import Benchmark
 
 
 class TrackBenchmark(Benchmark):
@@ -46,8 +46,8 @@ class TrackBenchmark(Benchmark):
         benchmark.
         """
         Benchmark.__init__(self, name, func, attr_sources)
-        self.type = _get_first_attr(attr_sources, "type", "track")
-        self.unit = _get_first_attr(attr_sources, "unit", "unit")
+        self.type = self._first_attr("type", "track")
+        self.unit = self._first_attr("unit", "unit")
 
     def run(self, *param):
         """
@@ -1,15 +1,41 @@
+import concurrent.futures
+import hashlib
 import importlib
+import importlib.machinery
 import inspect
 import json
+import mmap
 import os
 import pkgutil
+import re
+import sys
+import tempfile
+import time
 import traceback
 
+# py37 doesn't have importlib.metadata
+try:
+    from importlib.metadata import distributions
+except ImportError:
+    from importlib_metadata import distributions
+
 from ._aux import update_sys_path
+from ._static_discovery import load_static_module
 from .benchmarks import benchmark_types
 
+# Format version of the discovery cache file
+DISCOVERY_CACHE_VERSION = 1
+
+# Format version of the benchmark index file
+BENCHMARK_INDEX_VERSION = 1
+
+# Fields of NDJSON listings written once per distinct value with `dedup`
+_BLOB_FIELDS = ("code", "params")
 
-def _get_benchmark(attr_name, module, klass, func):
+
+def _get_benchmark(
+    attr_name, module, klass, func, benchmark_filter=None, instances=None
+):
     """
     Retrieves benchmark function based on attribute name, module, class, and
     function.
@@ -27,6 +53,13 @@ def _get_benchmark(attr_name, module, klass, func):
     **func** (function)
     : The function to be benchmarked.
 
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Benchmarks it does not select are not created.
+
+    **instances** (`dict`, optional)
+    : Instances of benchmark classes by class, shared by the benchmarks of a
+    class unless it sets `shared_instance = False`.
+
     #### Returns
     **benchmark** (Benchmark instance or None)
     : A benchmark instance with the name of the benchmark, the function to be
@@ -37,7 +70,8 @@ def _get_benchmark(attr_name, module, klass, func):
     The function tries to get the `benchmark_name` from `func`. If it fails, it
     uses `attr_name` to match with the name regex in the benchmark types.  If a
     match is found, it creates a new benchmark instance and returns it.  If no
-    match is found or the function is marked to be skipped, it returns None.
+    match is found, the function is marked to be skipped or the filter does
+    not select it, it returns None. Nothing is instantiated before that.
     """
     # Check if the function has been marked to be skipped
     if getattr(func, "skip_benchmark", False):
@@ -58,20 +92,176 @@ def _get_benchmark(attr_name, module, klass, func):
         return
     # relative to benchmark_dir
     mname_parts = module.__name__.split(".", 1)[1:]
-    if klass is None:
-        if name is None:
+    if name is None:
+        if klass is None:
             name = ".".join(mname_parts + [func.__name__])
+        else:
+            name = ".".join(mname_parts + [klass.__name__, attr_name])
+    if benchmark_filter is not None and not benchmark_filter.match(
+        name, module.__name__
+    ):
+        return
+
+    if klass is None:
         sources = [func, module]
     else:
-        instance = klass()
+        instance = _class_instance(klass, instances)
         func = getattr(instance, attr_name)
-        if name is None:
-            name = ".".join(mname_parts + [klass.__name__, attr_name])
         sources = [func, instance, module]
     return cls(name, func, sources)
 
 
-def disc_modules(module_name, ignore_import_errors=False):
+def _class_instance(klass, instances=None):
+    """
+    Returns an instance of a benchmark class, shared through `instances`.
+
+    #### Parameters
+    **klass** (class)
+    : A benchmark class.
+
+    **instances** (`dict` or None)
+    : Instances already created, by class. Without it, or if the class sets
+    `shared_instance = False`, a new instance is returned.
+
+    #### Returns
+    **instance** (object)
+    : An instance of `klass`.
+
+    #### Notes
+    Discovery shares one instance between all the benchmarks of a class, so
+    that its `__init__` runs once instead of once per benchmark. Suites whose
+    benchmarks rely on an instance of their own opt out with the class
+    attribute `shared_instance = False`.
+    """
+    if instances is None or not getattr(klass, "shared_instance", True):
+        return klass()
+    try:
+        return instances[klass]
+    except KeyError:
+        pass
+    instance = instances[klass] = klass()
+    return instance
+
+
+def _class_members(klass):
+    """
+    Yields the functions and methods of a class, as `inspect.getmembers`.
+
+    #### Parameters
+    **klass** (class)
+    : A benchmark class.
+
+    #### Yields
+    **name** (`str`)
+    : The name of the member.
+
+    **member** (function or method)
+    : The member, looked up on the class.
+
+    #### Notes
+    Only the `__dict__` of the classes in the MRO are walked, which leaves out
+    the many attributes of `object` that `inspect.getmembers` looks up through
+    `dir`. Members are yielded sorted by name, as `inspect.getmembers` does.
+    """
+    names = set()
+    for base in klass.__mro__:
+        if base is not object:
+            names.update(base.__dict__)
+    for name in sorted(names):
+        try:
+            member = getattr(klass, name)
+        except AttributeError:
+            continue
+        if inspect.isfunction(member) or inspect.ismethod(member):
+            yield name, member
+
+
+def _benchmark_kind(name):
+    """
+    Returns the kind of a benchmark from its name: the name of the benchmark
+    type the last part of the name matches, without the `Benchmark` suffix and
+    in lower case ("time", "track", "peakmem"...), or None.
+    """
+    search = name.rsplit(".", 1)[-1]
+    for cls in benchmark_types:
+        if cls.name_regex.match(search):
+            kind = cls.__name__
+            if kind.endswith("Benchmark"):
+                kind = kind[: -len("Benchmark")]
+            return kind.lower()
+    return None
+
+
+class BenchmarkFilter:
+    """
+    Selects benchmarks by name, kind and module, before they are created.
+
+    #### Parameters
+    **names** (list of `str`, optional)
+    : Regular expressions, one of which must be found in the benchmark name
+    (with `re.search`, as the `--bench` option of asv).
+
+    **kinds** (list of `str`, optional)
+    : Benchmark kinds, one of which must be that of the benchmark: "time",
+    "timeraw", "track", "mem" or "peakmem", or the lowercase name of a
+    benchmark type from a plugin without its `Benchmark` suffix.
+
+    **modules** (list of `str`, optional)
+    : Dotted module names relative to the suite root, such as "sub.module":
+    the benchmark must be defined in one of them or in one of their
+    submodules. Other modules are not imported at all.
+
+    #### Notes
+    Empty criteria select everything.
+    """
+
+    def __init__(self, names=(), kinds=(), modules=()):
+        self.names = [re.compile(name) for name in names]
+        self.kinds = set(kinds)
+        self.modules = list(modules)
+
+    def __bool__(self):
+        return bool(self.names or self.kinds or self.modules)
+
+    def match(self, name, module_name):
+        """
+        Whether to select a benchmark.
+
+        #### Parameters
+        **name** (`str`)
+        : Fully-qualified name of the benchmark.
+
+        **module_name** (`str`)
+        : Full name of the module the benchmark is defined in.
+        """
+        if self.names and not any(regex.search(name) for regex in self.names):
+            return False
+        if self.kinds and _benchmark_kind(name) not in self.kinds:
+            return False
+        if self.modules:
+            module = module_name.partition(".")[2]
+            return any(
+                module == prefix or module.startswith(prefix + ".")
+                for prefix in self.modules
+            )
+        return True
+
+    def match_module(self, module_name):
+        """Whether a module, by its full name, has to be imported: it is one of
+        the selected modules, within one, or a package containing one."""
+        if not self.modules:
+            return True
+        module = module_name.partition(".")[2]
+        return any(
+            module == prefix
+            or module.startswith(prefix + ".")
+            or not module
+            or prefix.startswith(module + ".")
+            for prefix in self.modules
+        )
+
+
+def disc_modules(module_name, ignore_import_errors=False, benchmark_filter=None):
     """
     Recursively imports a module and all sub-modules in the package.
 
@@ -82,6 +272,9 @@ def disc_modules(module_name, ignore_import_errors=False):
     **ignore_import_errors** (`bool`, optional)
     : Whether to ignore import errors. Default is False.
 
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Sub-modules that cannot hold selected benchmarks are not imported.
+
     #### Yields
     **module** (module)
     : The imported module in the package tree.
@@ -106,10 +299,11 @@ def disc_modules(module_name, ignore_import_errors=False):
 
     if getattr(module, "__path__", None):
         for _, name, _ in pkgutil.iter_modules(module.__path__, f"{module_name}."):
-            yield from disc_modules(name, ignore_import_errors)
+            if benchmark_filter is None or benchmark_filter.match_module(name):
+                yield from disc_modules(name, ignore_import_errors, benchmark_filter)
 
 
-def disc_benchmarks(root, ignore_import_errors=False):
+def disc_benchmarks(root, ignore_import_errors=False, benchmark_filter=None):
     """
     Discovers all benchmarks in a given directory tree, yielding Benchmark
     objects.
@@ -122,6 +316,10 @@ def disc_benchmarks(root, ignore_import_errors=False):
     **ignore_import_errors** (`bool`, optional)
     : Specifies if import errors should be ignored. Default is False.
 
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Only the benchmarks it selects are created, and only the modules that
+    may hold them are imported.
+
     #### Yields
     **benchmark** (Benchmark instance or None)
     : A benchmark instance containing the benchmark's name, the function to
@@ -141,25 +339,140 @@ def disc_benchmarks(root, ignore_import_errors=False):
     """
     root_name = os.path.basename(root)
 
-    for module in disc_modules(root_name, ignore_import_errors=ignore_import_errors):
-        for attr_name, module_attr in (
-            (k, v) for k, v in module.__dict__.items() if not k.startswith("_")
-        ):
-            if inspect.isclass(module_attr) and not inspect.isabstract(module_attr):
-                for name, class_attr in inspect.getmembers(module_attr):
-                    if inspect.isfunction(class_attr) or inspect.ismethod(class_attr):
-                        benchmark = _get_benchmark(
-                            name, module, module_attr, class_attr
-                        )
-                        if benchmark is not None:
-                            yield benchmark
-            elif inspect.isfunction(module_attr):
-                benchmark = _get_benchmark(attr_name, module, None, module_attr)
+    for module in disc_modules(
+        root_name,
+        ignore_import_errors=ignore_import_errors,
+        benchmark_filter=benchmark_filter,
+    ):
+        yield from _disc_module_benchmarks(module, benchmark_filter)
+
+
+def _current_rss():
+    """Returns the resident set size of the process in bytes, or None if it
+    cannot be read."""
+    try:
+        with open("/proc/self/statm", "rb") as fp:
+            return int(fp.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _measure(func, *args):
+    """
+    Calls a function and measures its cost.
+
+    #### Returns
+    **result** (object)
+    : The return value of `func`.
+
+    **cost** (`dict`)
+    : The `"wall"` and `"cpu"` times the call took in seconds, and the growth
+    of the resident set size in bytes, `"rss"`, or None where it cannot be
+    read (outside of Linux).
+    """
+    rss = _current_rss()
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    result = func(*args)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    if rss is not None:
+        rss = _current_rss() - rss
+    return result, {"wall": wall, "cpu": cpu, "rss": rss}
+
+
+def _disc_module_benchmarks(module, benchmark_filter=None):
+    """
+    Yields the benchmarks defined in an imported module, as `disc_benchmarks`.
+
+    #### Parameters
+    **module** (module)
+    : A module of the benchmark suite.
+
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Selects the benchmarks to create.
+
+    #### Yields
+    **benchmark** (Benchmark instance)
+    : The benchmarks found among the classes and free functions of the module.
+    """
+    for benchmark, _ in _disc_module_entries(module, benchmark_filter):
+        yield benchmark
+
+
+def _disc_module_entries(module, benchmark_filter=None):
+    """
+    Yields the benchmarks defined in an imported module, together with where
+    they are found.
+
+    #### Parameters
+    **module** (module)
+    : A module of the benchmark suite.
+
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Selects the benchmarks to create.
+
+    #### Yields
+    **benchmark** (Benchmark instance)
+    : The benchmarks found among the classes and free functions of the module.
+
+    **location** (`list`)
+    : The module name, the name of the class in the module or None, and the
+    name of the function in the module or class; see `_locate_benchmark`.
+    """
+    instances = {}
+    for attr_name, module_attr in (
+        (k, v) for k, v in module.__dict__.items() if not k.startswith("_")
+    ):
+        if inspect.isclass(module_attr) and not inspect.isabstract(module_attr):
+            for name, class_attr in _class_members(module_attr):
+                benchmark = _get_benchmark(
+                    name, module, module_attr, class_attr, benchmark_filter, instances
+                )
                 if benchmark is not None:
-                    yield benchmark
+                    yield benchmark, [module.__name__, attr_name, name]
+        elif inspect.isfunction(module_attr):
+            benchmark = _get_benchmark(
+                attr_name, module, None, module_attr, benchmark_filter
+            )
+            if benchmark is not None:
+                yield benchmark, [module.__name__, None, attr_name]
+
+
+def _locate_benchmark(name, location):
+    """
+    Creates a benchmark from its location in a benchmark index.
+
+    #### Parameters
+    **name** (`str`)
+    : Fully-qualified name of the benchmark.
+
+    **location** (`list`)
+    : The module name, the name of the class in the module or None, and the
+    name of the function in the module or class.
+
+    #### Returns
+    **benchmark** (Benchmark instance or None)
+    : The benchmark, or None if it is no longer found there.
+    """
+    module_name, class_name, attr_name = location
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        return None
+    klass = getattr(module, class_name, None) if class_name else None
+    func = getattr(klass if class_name else module, attr_name, None)
+    if class_name and not inspect.isclass(klass):
+        return None
+    if not (inspect.isfunction(func) or inspect.ismethod(func)):
+        return None
+    benchmark = _get_benchmark(attr_name, module, klass, func)
+    if benchmark is None or benchmark.name != name:
+        return None
+    return benchmark
 
 
-def get_benchmark_from_name(root, name, extra_params=None):
+def get_benchmark_from_name(root, name, extra_params=None, index_file=None):
     """
     Creates a benchmark from a fully-qualified benchmark name.
 
@@ -173,6 +486,10 @@ def get_benchmark_from_name(root, name, extra_params=None):
     **extra_params** (`dict`, optional)
     : Extra parameters to be added to the benchmark.
 
+    **index_file** (`str`, optional)
+    : A benchmark index written by `list_benchmarks`. The benchmark is first
+    looked up there, which imports only its module.
+
     #### Returns
     **benchmark** (Benchmark instance)
     : A benchmark instance created from the given fully-qualified benchmark name.
@@ -186,28 +503,27 @@ def get_benchmark_from_name(root, name, extra_params=None):
     name. It splits the name using the "-" character. If "-" is present in the
     name, the string after the "-" is converted to an integer and is considered as
     the parameter index. If "-" is not present, the parameter index is set to
-    None.  The function then tries to directly import the benchmark function by
+    None.  The function then looks the benchmark up in the index, if any, and
+    otherwise tries to directly import the benchmark function by
     guessing its import module name. If the benchmark is not found this way, the
     function searches for the benchmark in the directory tree root using
     `disc_benchmarks`. If the benchmark is still not found, it raises a
     ValueError.  If extra parameters are provided, they are added to the
     benchmark.
     """
-    if "-" in name:
-        try:
-            name, param_idx = name.split("-", 1)
-            param_idx = int(param_idx)
-        except ValueError:
-            raise ValueError(f"Benchmark id {name!r} is invalid")
-    else:
-        param_idx = None
+    name, param_idx = _parse_benchmark_id(name)
 
     update_sys_path(root)
     benchmark = None
 
+    if index_file is not None:
+        location = _read_index(index_file).get(name)
+        if location is not None:
+            benchmark = _locate_benchmark(name, location)
+
     # try to directly import benchmark function by guessing its import module name
     parts = name.split(".")
-    for i in [1, 2]:
+    for i in [1, 2] if benchmark is None else []:
         path = f"{os.path.join(root, *parts[:-i])}.py"
         if not os.path.isfile(path):
             continue
@@ -236,6 +552,54 @@ def get_benchmark_from_name(root, name, extra_params=None):
         else:
             raise ValueError(f"Could not find benchmark '{name}'")
 
+    _select_benchmark(benchmark, param_idx, extra_params)
+    return benchmark
+
+
+def _parse_benchmark_id(benchmark_id):
+    """
+    Splits a benchmark id into the benchmark name and the parameter index.
+
+    #### Parameters
+    **benchmark_id** (`str`)
+    : A fully-qualified benchmark name, optionally followed by "-" and the
+    index of a parameter combination.
+
+    #### Returns
+    **name** (`str`)
+    : The fully-qualified benchmark name.
+
+    **param_idx** (`int` or None)
+    : The parameter index, or None if the id has none.
+
+    #### Raises
+    **ValueError**
+    : If the parameter index is not an integer.
+    """
+    if "-" not in benchmark_id:
+        return benchmark_id, None
+    try:
+        name, param_idx = benchmark_id.split("-", 1)
+        return name, int(param_idx)
+    except ValueError:
+        raise ValueError(f"Benchmark id {benchmark_id!r} is invalid")
+
+
+def _select_benchmark(benchmark, param_idx, extra_params):
+    """
+    Selects the parameter combination of a benchmark and adds extra parameters
+    to its attribute sources.
+
+    #### Parameters
+    **benchmark** (Benchmark instance)
+    : The benchmark, which is modified in place.
+
+    **param_idx** (`int` or None)
+    : The parameter index, or None to keep the current parameters.
+
+    **extra_params** (`dict` or None)
+    : Extra parameters to be added to the benchmark.
+    """
     if param_idx is not None:
         benchmark.set_param_idx(param_idx)
 
@@ -247,11 +611,382 @@ def get_benchmark_from_name(root, name, extra_params=None):
         for key, value in extra_params.items():
             setattr(ExtraBenchmarkAttrs, key, value)
         benchmark._attr_sources.insert(0, ExtraBenchmarkAttrs)
+        benchmark._invalidate_attrs()
 
-    return benchmark
 
+def _iter_module_files(root):
+    """
+    Lists the modules of a benchmark suite without importing them.
 
-def list_benchmarks(root, fp):
+    #### Parameters
+    **root** (`str`)
+    : Path to the root of a benchmark suite.
+
+    #### Yields
+    **module_name** (`str`)
+    : The name of a module, in the order `disc_modules` imports them.
+
+    **path** (`str` or None)
+    : The file of the module, or None for a namespace package.
+
+    #### Notes
+    Packages are searched through the directories their spec declares, which
+    is their `__path__` unless their `__init__` changes it at import time.
+    """
+    root_name = os.path.basename(root)
+    spec = importlib.machinery.PathFinder.find_spec(
+        root_name, [os.path.dirname(os.path.abspath(root))]
+    )
+    if spec is None:
+        raise ImportError(f"No module named {root_name!r}", name=root_name)
+    stack = [(root_name, spec)]
+    while stack:
+        module_name, spec = stack.pop()
+        yield module_name, (spec.origin if spec.has_location else None)
+        if spec.submodule_search_locations:
+            children = []
+            for finder, name, _ in pkgutil.iter_modules(
+                list(spec.submodule_search_locations), f"{module_name}."
+            ):
+                child_spec = finder.find_spec(name)
+                if child_spec is not None:
+                    children.append((name, child_spec))
+            stack.extend(reversed(children))
+
+
+def _environment_key():
+    """
+    Returns a digest identifying the interpreter and the installed packages,
+    which the listing of a benchmark module can depend on.
+    """
+    h = hashlib.sha256()
+    for part in (sys.version, sys.executable, sys.prefix):
+        h.update(part.encode("utf-8", "surrogateescape") + b"\0")
+    packages = sorted(
+        f"{dist.metadata.get('Name', '')}=={dist.version}" for dist in distributions()
+    )
+    for package in packages:
+        h.update(package.encode("utf-8", "surrogateescape") + b"\0")
+    return h.hexdigest()
+
+
+def _benchmark_listing(benchmark):
+    """
+    Returns the attributes of a benchmark reported by `list_benchmarks`: those
+    of types `str`, `int`, `float`, `list`, `dict`, `bool` that don't start
+    with an underscore `_`. Lazy attributes are computed, unless they are not
+    listed anyway.
+    """
+    listing = {}
+    for k in list(benchmark.__dict__):
+        if k.startswith("_"):
+            continue
+        if not getattr(getattr(type(benchmark), k, None), "listed", True):
+            continue
+        v = getattr(benchmark, k)
+        if isinstance(v, (str, int, float, list, dict, bool)):
+            listing[k] = v
+    return listing
+
+
+class _DiscoveryCache:
+    """
+    On-disk cache of the benchmark listings of the modules of a suite.
+
+    #### Parameters
+    **path** (`str`)
+    : The cache file. It is created if missing, and ignored if it was written
+    by another interpreter or environment.
+
+    #### Notes
+    The listing of a module is stored together with the size, modification
+    time and SHA-256 of its file, and reused while the content of the file is
+    unchanged; the hash is only recomputed when the size or modification time
+    differ. Listings that depend on files other than the module itself (data
+    files, or helper modules the benchmarks import) are not tracked: removing
+    the cache file forces a full discovery.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.environment = _environment_key()
+        self.modules = {}
+        self.changed = False
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+        if (
+            isinstance(data, dict)
+            and data.get("version") == DISCOVERY_CACHE_VERSION
+            and data.get("environment") == self.environment
+        ):
+            self.modules = data["modules"]
+
+    def get(self, module_name, path):
+        """
+        Returns the cached listing of a module, or None if it is out of date.
+        The stored file stamp is refreshed if only the modification time
+        changed.
+        """
+        entry = self.modules.get(module_name)
+        if entry is None or entry["path"] != path:
+            return None
+        if path is None:
+            return entry["benchmarks"]
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if [st.st_size, st.st_mtime_ns] == entry["stamp"]:
+            return entry["benchmarks"]
+        if _file_digest(path) != entry["sha256"]:
+            return None
+        entry["stamp"] = [st.st_size, st.st_mtime_ns]
+        self.changed = True
+        return entry["benchmarks"]
+
+    def set(self, module_name, path, benchmarks):
+        """Stores the listing of a module that has just been imported."""
+        entry = {"path": path, "benchmarks": benchmarks}
+        if path is not None:
+            st = os.stat(path)
+            entry["stamp"] = [st.st_size, st.st_mtime_ns]
+            entry["sha256"] = _file_digest(path)
+        self.modules[module_name] = entry
+        self.changed = True
+
+    def save(self, module_names):
+        """
+        Writes the cache file if anything changed, keeping only the modules in
+        `module_names`.
+        """
+        for module_name in set(self.modules) - set(module_names):
+            del self.modules[module_name]
+            self.changed = True
+        if not self.changed:
+            return
+        data = {
+            "version": DISCOVERY_CACHE_VERSION,
+            "environment": self.environment,
+            "modules": self.modules,
+        }
+        _write_json(self.path, data)
+
+
+def _write_json(path, data):
+    """Writes a JSON file atomically, so that readers never see it partly
+    written."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(data, fp, skipkeys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_index(index_file):
+    """
+    Reads a benchmark index written by `list_benchmarks`.
+
+    #### Returns
+    **index** (`dict`)
+    : The location of every benchmark by name, see `_disc_module_entries`;
+    empty if the file is missing or has another format.
+    """
+    try:
+        with open(index_file) as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != BENCHMARK_INDEX_VERSION:
+        return {}
+    return data["benchmarks"]
+
+
+def _file_digest(path):
+    """Returns the SHA-256 hex digest of the content of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _static_listings(module_name, path, root_name, benchmark_filter=None):
+    """
+    Returns the listings and locations of the benchmarks of a module found
+    without importing it, or None if the module cannot be resolved statically.
+    """
+    if path is None:
+        return None
+    module = load_static_module(module_name, path, root_name)
+    if module is None:
+        return None
+    # `inspect.getmodule` looks functions up by their module name
+    previous = sys.modules.get(module_name)
+    sys.modules[module_name] = module
+    try:
+        return _module_listings(module, benchmark_filter)
+    except Exception:
+        # Let the import report the error
+        return None
+    finally:
+        if previous is None:
+            del sys.modules[module_name]
+        else:
+            sys.modules[module_name] = previous
+
+
+def _module_listings(module, benchmark_filter=None):
+    """Returns the listings and locations of the benchmarks of a module."""
+    return [
+        [_benchmark_listing(benchmark), location]
+        for benchmark, location in _disc_module_entries(module, benchmark_filter)
+    ]
+
+
+def _import_listings(module_name, benchmark_filter=None):
+    """
+    Imports a module of a suite and returns the listings and locations of its
+    benchmarks, with the costs of the import and of the construction and
+    listing of the benchmarks (see `_measure`); run in the worker processes
+    of `_disc_listings`.
+    """
+    module, import_cost = _measure(importlib.import_module, module_name)
+    listings, cost = _measure(_module_listings, module, benchmark_filter)
+    return listings, {"import": import_cost, "benchmarks": cost}
+
+
+def _disc_listings(
+    root, cache_file=None, static=False, jobs=1, report=None, benchmark_filter=None
+):
+    """
+    Yields the listing and location of every benchmark of a suite, module by
+    module.
+
+    #### Parameters
+    **root** (`str`)
+    : Path to the root of a benchmark suite.
+
+    **cache_file** (`str`, optional)
+    : The discovery cache file, see `_DiscoveryCache`. Modules whose cached
+    listing is up to date are not imported.
+
+    **static** (`bool`, optional)
+    : Whether to find the benchmarks of a module from its source, without
+    importing it; see `load_static_module`. Modules that cannot be resolved
+    statically are imported.
+
+    **jobs** (`int`, optional)
+    : The number of worker processes importing modules. With more than one,
+    the modules are imported concurrently, each in a single worker, and their
+    listings are yielded in the same order as serially.
+
+    **report** (`dict`, optional)
+    : When given, the costs of discovering every module are recorded in it,
+    by module name: the `"import"` of the module, the construction and listing
+    of its `"benchmarks"` (see `_measure`), their `"count"` and the `"source"`
+    of the listing: `"cache"`, `"static"` or `"import"`. For static modules,
+    `"benchmarks"` includes parsing the module.
+
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Selects the benchmarks to list; the others are not created, nor are the
+    modules that cannot hold selected benchmarks imported. Cached listings
+    are filtered, but the partial listings of the other modules are not
+    cached.
+
+    #### Yields
+    **listing** (`dict`)
+    : The attributes of a benchmark, as written by `list_benchmarks`.
+
+    **location** (`list`)
+    : Where the benchmark is defined, see `_disc_module_entries`.
+    """
+    cache = None if cache_file is None else _DiscoveryCache(cache_file)
+    benchmark_filter = benchmark_filter or None
+    root_name = os.path.basename(root)
+    pool = None
+    module_names = []
+    modules = []
+    try:
+        # Resolve what can be without importing, and start the imports
+        for module_name, path in _iter_module_files(root):
+            module_names.append(module_name)
+            if benchmark_filter and not benchmark_filter.match_module(module_name):
+                continue
+            entry = {"source": "cache"}
+            listings = None if cache is None else cache.get(module_name, path)
+            if listings is not None and benchmark_filter:
+                listings = [
+                    [listing, location]
+                    for listing, location in listings
+                    if benchmark_filter.match(listing["name"], location[0])
+                ]
+            if listings is None and static:
+                entry = {"source": "static"}
+                listings, entry["benchmarks"] = _measure(
+                    _static_listings, module_name, path, root_name, benchmark_filter
+                )
+            if listings is None:
+                entry = {"source": "import"}
+                if jobs > 1:
+                    if pool is None:
+                        pool = concurrent.futures.ProcessPoolExecutor(
+                            max_workers=jobs,
+                            initializer=update_sys_path,
+                            initargs=(root,),
+                        )
+                    listings = pool.submit(
+                        _import_listings, module_name, benchmark_filter
+                    )
+            modules.append((module_name, path, listings, entry))
+
+        for module_name, path, listings, entry in modules:
+            if listings is None:
+                listings, costs = _import_listings(module_name, benchmark_filter)
+                entry.update(costs)
+            elif isinstance(listings, concurrent.futures.Future):
+                listings, costs = listings.result()
+                entry.update(costs)
+            if (
+                cache is not None
+                and entry["source"] != "cache"
+                and benchmark_filter is None
+            ):
+                # Round trip, so cached and fresh listings are identical
+                listings = json.loads(json.dumps(listings, skipkeys=True))
+                cache.set(module_name, path, listings)
+            if report is not None:
+                entry["count"] = len(listings)
+                report[module_name] = entry
+            yield from listings
+    finally:
+        if pool is not None:
+            for _, _, listings, _ in modules:
+                if isinstance(listings, concurrent.futures.Future):
+                    listings.cancel()
+            pool.shutdown()
+    if cache is not None:
+        cache.save(module_names)
+
+
+def list_benchmarks(
+    root,
+    fp,
+    cache_file=None,
+    static=False,
+    jobs=1,
+    index_file=None,
+    report_file=None,
+    benchmark_filter=None,
+    ndjson=False,
+    dedup=False,
+):
     """
     Lists all discovered benchmarks to a file pointer as JSON.
 
@@ -262,6 +997,47 @@ def list_benchmarks(root, fp):
     **fp** (file object)
     : File pointer where the JSON list of benchmarks should be written.
 
+    **cache_file** (`str`, optional)
+    : Path of a discovery cache file. When given, the listing of every module
+    whose file is unchanged since it was cached is read from it, and only the
+    other modules are imported.
+
+    **static** (`bool`, optional)
+    : Whether to list the benchmarks of the modules that only define functions,
+    classes and literals from their source code, without importing them; see
+    `load_static_module`.
+
+    **jobs** (`int`, optional)
+    : The number of processes importing the modules of the suite. With more
+    than one, modules are imported concurrently in worker processes, which
+    send back the listings of their benchmarks. The listing is the same as
+    with a single process, unless importing a module changes what another one
+    defines.
+
+    **index_file** (`str`, optional)
+    : Path of a benchmark index to write, mapping the name of every benchmark
+    to its module, class and function; see `get_benchmark_from_name`.
+
+    **report_file** (`str`, optional)
+    : Path of a JSON report to write on the cost of discovery: for every
+    module, the wall and CPU time and memory taken by its import and by the
+    construction and listing of its benchmarks, and the number of benchmarks;
+    see `_disc_listings`.
+
+    **benchmark_filter** (`BenchmarkFilter`, optional)
+    : Lists only the benchmarks it selects. The others are not created, and
+    the modules that cannot hold selected benchmarks are not imported.
+
+    **ndjson** (`bool`, optional)
+    : Whether to write one benchmark per line, flushing every line as soon as
+    the benchmark is discovered, instead of a single JSON list written as a
+    whole; see `read_ndjson_listing`.
+
+    **dedup** (`bool`, optional)
+    : With `ndjson`, whether to write the `code` and `params` shared by several
+    benchmarks only once, and refer to them by hash from then on; see
+    `_write_ndjson_listing`.
+
     #### Notes
     The function updates the system path with the root directory of the
     benchmark suite. Then, it iterates over all benchmarks discovered in the
@@ -269,24 +1045,204 @@ def list_benchmarks(root, fp):
     attributes of the benchmark that are of types `str`, `int`, `float`, `list`,
     `dict`, `bool` and don't start with an underscore `_`.  These attribute
     dictionaries are then dumped as JSON into the file pointed by `fp`.
+
+    With a cache, the listings are kept per module, together with the size,
+    modification time and content hash of the module file and the identity of
+    the interpreter and of the installed packages; see `_DiscoveryCache`.
     """
+    start = time.perf_counter()
     update_sys_path(root)
 
+    report = None if report_file is None else {}
+    if (
+        cache_file is None
+        and not static
+        and jobs <= 1
+        and index_file is None
+        and report is None
+    ):
+        entries = (
+            (_benchmark_listing(b), None)
+            for b in disc_benchmarks(root, benchmark_filter=benchmark_filter)
+        )
+    else:
+        entries = _disc_listings(
+            root,
+            cache_file=cache_file,
+            static=static,
+            jobs=jobs,
+            report=report,
+            benchmark_filter=benchmark_filter,
+        )
+
     # Streaming of JSON back out to the master process
+    if ndjson:
+        index = _write_ndjson_listing(fp, entries, dedup)
+    else:
+        index = _write_json_listing(fp, entries)
+
+    if index_file is not None:
+        _write_json(
+            index_file, {"version": BENCHMARK_INDEX_VERSION, "benchmarks": index}
+        )
+
+    if report_file is not None:
+        _write_json(
+            report_file,
+            {"wall": time.perf_counter() - start, "modules": report},
+        )
+
+
+def _write_json_listing(fp, entries):
+    """
+    Writes benchmark listings to a file pointer as a JSON list.
+
+    #### Parameters
+    **fp** (file object)
+    : File pointer where the JSON list of benchmarks is written.
+
+    **entries** (iterable)
+    : The listing and the location of every benchmark.
+
+    #### Returns
+    **index** (`dict`)
+    : The location of every benchmark, by name.
+    """
+    index = {}
     fp.write("[")
     first = True
-    for benchmark in disc_benchmarks(root):
+    for clean, location in entries:
         if not first:
             fp.write(", ")
-        clean = {
-            k: v
-            for (k, v) in benchmark.__dict__.items()
-            if isinstance(v, (str, int, float, list, dict, bool))
-            and not k.startswith("_")
-        }
         json.dump(clean, fp, skipkeys=True)
         first = False
+        index[clean["name"]] = location
     fp.write("]")
+    return index
+
+
+def _write_ndjson_listing(fp, entries, dedup=False):
+    """
+    Writes benchmark listings to a file pointer as NDJSON, one line per
+    benchmark, flushed as soon as it is written.
+
+    #### Parameters
+    **fp** (file object)
+    : File pointer where the benchmarks are written.
+
+    **entries** (iterable)
+    : The listing and the location of every benchmark.
+
+    **dedup** (`bool`, optional)
+    : Whether to write every distinct value of the `_BLOB_FIELDS` only once.
+
+    #### Returns
+    **index** (`dict`)
+    : The location of every benchmark, by name.
+
+    #### Notes
+    With `dedup`, a value of one of the `_BLOB_FIELDS` whose JSON encoding is
+    longer than its hash is replaced by `{"$blob": HASH}`, the SHA-256 of the
+    encoding. The first benchmark referring to a value is preceded by the line
+    `{"$blob": HASH, "value": VALUE}`, so that readers know every value before
+    it is referred to.
+    """
+    index = {}
+    blobs = set()
+    for clean, location in entries:
+        if dedup:
+            clean = dict(clean)
+            for field in _BLOB_FIELDS:
+                if field not in clean:
+                    continue
+                encoded = json.dumps(clean[field])
+                digest = hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+                if len(encoded) <= len(digest):
+                    continue
+                if digest not in blobs:
+                    blobs.add(digest)
+                    fp.write(f'{{"$blob": "{digest}", "value": {encoded}}}\n')
+                clean[field] = {"$blob": digest}
+        json.dump(clean, fp, skipkeys=True)
+        fp.write("\n")
+        fp.flush()
+        index[clean["name"]] = location
+    return index
+
+
+def read_ndjson_listing(fp):
+    """
+    Reads a benchmark listing written by `list_benchmarks` with `ndjson`.
+
+    #### Parameters
+    **fp** (file object)
+    : File pointer to read the listing from. Reading stops at the end of the
+    file, which may still be written to.
+
+    #### Yields
+    **benchmark** (`dict`)
+    : The attributes of every benchmark, with the values written once under a
+    hash restored.
+    """
+    blobs = {}
+    for line in fp:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "name" not in record:
+            blobs[record["$blob"]] = record["value"]
+            continue
+        for field in _BLOB_FIELDS:
+            value = record.get(field)
+            if isinstance(value, dict) and "$blob" in value:
+                record[field] = blobs[value["$blob"]]
+        yield record
+
+
+def _parse_discover_options(args):
+    """
+    Parses the options of `_discover`: `--cache-file=PATH`, `--static`,
+    `--jobs=N`, `--index-file=PATH`, `--report-file=PATH`, `--ndjson`,
+    `--dedup`, and the `--bench=REGEX`, `--kind=KIND` and `--module=MODULE`
+    filters, which may be repeated; see `BenchmarkFilter`.
+
+    #### Returns
+    **options** (`dict`)
+    : Keyword arguments for `list_benchmarks`.
+
+    #### Raises
+    **ValueError**
+    : If an option is not recognized, or if `--dedup` is given without
+    `--ndjson`.
+    """
+    options = {}
+    filters = {"names": [], "kinds": [], "modules": []}
+    filter_options = {"--bench=": "names", "--kind=": "kinds", "--module=": "modules"}
+    for arg in args:
+        prefix = arg.partition("=")[0] + "="
+        if prefix in filter_options:
+            filters[filter_options[prefix]].append(arg[len(prefix) :])
+        elif arg == "--static":
+            options["static"] = True
+        elif arg.startswith("--cache-file="):
+            options["cache_file"] = arg[len("--cache-file=") :]
+        elif arg.startswith("--jobs="):
+            options["jobs"] = int(arg[len("--jobs=") :])
+        elif arg.startswith("--index-file="):
+            options["index_file"] = arg[len("--index-file=") :]
+        elif arg.startswith("--report-file="):
+            options["report_file"] = arg[len("--report-file=") :]
+        elif arg == "--ndjson":
+            options["ndjson"] = True
+        elif arg == "--dedup":
+            options["dedup"] = True
+        else:
+            raise ValueError(f"Unknown discovery option {arg!r}")
+    if options.get("dedup") and not options.get("ndjson"):
+        raise ValueError("--dedup requires --ndjson")
+    if any(filters.values()):
+        options["benchmark_filter"] = BenchmarkFilter(**filters)
+    return options
 
 
 def _discover(args):
@@ -296,7 +1252,14 @@ def _discover(args):
 
     #### Parameters
     **args** (`tuple`)
-    : A tuple containing benchmark directory and result file path.
+    : A tuple containing benchmark directory, result file path and, optionally,
+    discovery options: `--cache-file=PATH` for the discovery cache of
+    `list_benchmarks`, `--static` for its static mode, `--jobs=N` for the
+    number of processes importing modules, `--index-file=PATH` to write a
+    benchmark index, `--report-file=PATH` to write a report on the cost of
+    discovery, `--bench=REGEX`, `--kind=KIND` and `--module=MODULE` to list
+    only some benchmarks, and `--ndjson` and `--dedup` to stream the listing
+    one benchmark per line.
 
     #### Notes
     The function takes a tuple as an argument. The first element of the tuple
@@ -305,6 +1268,7 @@ def _discover(args):
     calls the `list_benchmarks` function with the benchmark directory and the
     file pointer of the result file.
     """
-    benchmark_dir, result_file = args
+    benchmark_dir, result_file = args[:2]
+    options = _parse_discover_options(args[2:])
     with open(result_file, "w") as fp:
-        list_benchmarks(benchmark_dir, fp)
+        list_benchmarks(benchmark_dir, fp, **options)
@@ -1,10 +1,27 @@
+import contextlib
 import json
 import math
+import os
 import pickle
+import signal
+import traceback
 
 from ._aux import set_cpu_affinity_from_params
 from .benchmarks.mark import SkipNotImplemented
-from .discovery import get_benchmark_from_name
+from .discovery import _parse_benchmark_id, _select_benchmark, get_benchmark_from_name
+
+# Timeout of the parameter combinations of a sweep whose benchmark sets none,
+# the default benchmark timeout of asv
+_DEFAULT_SWEEP_TIMEOUT = 60.0
+
+
+class _SweepTimeout(BaseException):
+    """
+    Raised in a sweep when a parameter combination runs past its timeout.
+
+    Derives from `BaseException`, so that benchmarks catching `Exception` do not
+    swallow it.
+    """
 
 
 def _run(args):
@@ -36,7 +53,10 @@ def _run(args):
     - **benchmark_id** (`str`)
     : The id of the benchmark to run.
     - **params_str** (`str`)
-    : A string containing JSON-encoded extra parameters.
+    : A string containing JSON-encoded extra parameters. The `index_file`
+    parameter is the path of a benchmark index written by discovery, see
+    `get_benchmark_from_name`. The `sweep` parameter runs several parameter
+    combinations in this process, see `_run_sweep`.
     - **profile_path** (`str`)
     : The path for profile data. "None" implies no profiling.
     - **result_file** (`str`)
@@ -44,25 +64,106 @@ def _run(args):
     """
 
     (benchmark_dir, benchmark_id, params_str, profile_path, result_file) = args
+    _run_benchmark(benchmark_dir, benchmark_id, params_str, profile_path, result_file)
+
+
+def _run_benchmark(
+    benchmark_dir,
+    benchmark_id,
+    params_str,
+    profile_path,
+    result_file,
+    setup_caches=None,
+    benchmarks=None,
+):
+    """
+    Runs a specified benchmark and writes the result to a file.
+
+    #### Parameters
+    **benchmark_dir**, **benchmark_id**, **params_str**, **profile_path**,
+    **result_file**
+    : As in the `args` tuple of `_run`.
+
+    **setup_caches** (`dict`, optional)
+    : Memo of unpickled setup caches, keyed by the absolute path of their
+    pickle file. When given, a process that runs several benchmarks loads
+    each `cache.pickle` only once and shares the object between them.
+
+    **benchmarks** (`dict`, optional)
+    : Index of already discovered, unused `Benchmark` objects by name. The
+    benchmark is taken out of the index if it is there, so that every run
+    gets a fresh object; otherwise it is looked up with
+    `get_benchmark_from_name`.
 
+    #### Raises
+    **ValueError**
+    : If a `sweep` is asked for a benchmark id with a parameter index, or
+    with a profile path.
+    """
     extra_params = json.loads(params_str)
     set_cpu_affinity_from_params(extra_params)
     extra_params.pop("cpu_affinity", None)
+    index_file = extra_params.pop("index_file", None)
+    sweep = extra_params.pop("sweep", False)
 
     if profile_path == "None":
         profile_path = None
 
-    benchmark = get_benchmark_from_name(
-        benchmark_dir, benchmark_id, extra_params=extra_params
-    )
+    name, param_idx = _parse_benchmark_id(benchmark_id)
+    if sweep is not False and (param_idx is not None or profile_path is not None):
+        raise ValueError(
+            f"Sweeps take a benchmark name without parameter index and no "
+            f"profile path, got {benchmark_id!r} and {profile_path!r}"
+        )
+    benchmark = benchmarks.pop(name, None) if benchmarks is not None else None
+    if benchmark is not None:
+        _select_benchmark(benchmark, param_idx, extra_params)
+    else:
+        benchmark = get_benchmark_from_name(
+            benchmark_dir,
+            benchmark_id,
+            extra_params=extra_params,
+            index_file=index_file,
+        )
 
     if benchmark.setup_cache_key is not None:
-        with open("cache.pickle", "rb") as fd:
-            cache = pickle.load(fd)
-        benchmark.set_cache(cache)
+        cache_file = os.path.abspath("cache.pickle")
+        if setup_caches is not None and cache_file in setup_caches:
+            cache = setup_caches[cache_file]
+        else:
+            with open(cache_file, "rb") as fd:
+                cache = pickle.load(fd)
+            if setup_caches is not None:
+                setup_caches[cache_file] = cache
     else:
-        benchmark.set_cache(None)
+        cache = None
+
+    if sweep is not False:
+        _run_sweep(benchmark, cache, sweep, result_file)
+        return
+
+    benchmark.set_cache(cache)
+    result = _run_params(benchmark, profile_path)
+
+    with open(result_file, "w") as fp:
+        json.dump(result, fp)
+
+
+def _run_params(benchmark, profile_path=None):
+    """
+    Sets up, runs and tears down a benchmark for its current parameters.
+
+    #### Parameters
+    **benchmark** (Benchmark instance)
+    : The benchmark, with its parameters and setup cache set.
+
+    **profile_path** (`str`, optional)
+    : The path to write profile data to, after the run.
 
+    #### Returns
+    **result** (`object`)
+    : The result of the benchmark, or `math.nan` if it is skipped.
+    """
     skip = benchmark.do_setup()
 
     try:
@@ -78,6 +179,102 @@ def _run(args):
                 result = math.nan
     finally:
         benchmark.do_teardown()
+    return result
+
+
+@contextlib.contextmanager
+def _time_limit(timeout):
+    """
+    Raises `_SweepTimeout` in the block if it runs for more than `timeout`
+    seconds, on platforms with `signal.setitimer`.
+    """
+    if not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise _SweepTimeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _sweep_indices(benchmark, sweep):
+    """
+    Returns the parameter indices selected by the `sweep` extra parameter:
+    all of them for `true`, else the list it gives.
+
+    #### Raises
+    **ValueError**
+    : If an index is not valid for the benchmark.
+    """
+    if sweep is True:
+        count = 1
+        for param in benchmark._params:
+            count *= len(param)
+        return range(count)
+    indices = list(sweep)
+    for param_idx in indices:
+        benchmark.get_param_tuple(param_idx)
+    return indices
+
+
+def _run_sweep(benchmark, cache, sweep, result_file):
+    """
+    Runs several parameter combinations of a benchmark, one after another in
+    this process.
+
+    #### Parameters
+    **benchmark** (Benchmark instance)
+    : The benchmark.
+
+    **cache** (`object`)
+    : The setup cache of the benchmark, or None.
+
+    **sweep** (`bool` or `list`)
+    : `True` to run all parameter combinations, or the list of their indices.
+
+    **result_file** (`str`)
+    : The path to the file the results are written to.
+
+    #### Notes
+    Every combination is set up, run and torn down as by a separate `_run`,
+    and the result file gets one JSON line per combination as soon as it
+    ends: `{"param_idx": IDX, "result": RESULT}`. A combination that raises
+    has its traceback printed and a `null` result with `"error": "failed"`.
+    One that runs past the `timeout` of the benchmark, 60 seconds unless set,
+    is interrupted with `SIGALRM` and has `"error": "timeout"`; there are no
+    such timeouts on platforms without `signal.setitimer`. The other
+    combinations still run in both cases.
+
+    This saves a process, an import of the benchmark and a load of its setup
+    cache per combination, at the cost of isolation: a combination can leave
+    state behind for the next ones. Running each combination in its own
+    process remains the default.
+    """
+    indices = _sweep_indices(benchmark, sweep)
+    timeout = benchmark._first_attr("timeout", None)
+    if timeout is None:
+        timeout = _DEFAULT_SWEEP_TIMEOUT
 
     with open(result_file, "w") as fp:
-        json.dump(result, fp)
+        for param_idx in indices:
+            benchmark.set_param_idx(param_idx)
+            benchmark.set_cache(cache)
+            record = {"param_idx": param_idx}
+            try:
+                with _time_limit(timeout):
+                    record["result"] = _run_params(benchmark)
+            except _SweepTimeout:
+                record.update(result=None, error="timeout")
+            except Exception:
+                traceback.print_exc()
+                record.update(result=None, error="failed")
+            json.dump(record, fp)
+            fp.write("\n")
+            fp.flush()
@@ -1,55 +1,1475 @@
+import collections
+import faulthandler
+import gc
 import json
+import mmap
 import os
+import pickle
+import selectors
+import signal
+import socket
 import struct
 import sys
 import tempfile
-import time
 import timeit
 
 from ._aux import posix_redirect_output, update_sys_path
-from .discovery import disc_benchmarks
-from .run import _run
+from .benchmarks._maxrss import set_cpu_affinity
+from .benchmarks.time import set_sample_callback
+from .discovery import _parse_benchmark_id, disc_benchmarks
+from .run import _run_benchmark
 
 wall_timer = timeit.default_timer
 
+# Delay between SIGTERM and SIGKILL for a child that ran past its timeout
+# (the step of the former polling loop).
+_SIGKILL_DELAY = 0.001
 
-def recvall(sock, size):
+# Delay before SIGKILL when the child dumps its stacks on SIGTERM; it exits by
+# itself right after the dump, which a shorter delay could cut off
+_STACK_DUMP_KILL_DELAY = 0.5
+
+# Name of the signal asking a child to dump its stacks, which not every
+# platform has (see `_stack_sample_signal`), and the interval between dumps in
+# the final seconds before a timeout (see `stack_sample_time`)
+_STACK_SAMPLE_SIGNAL = "SIGUSR1"
+_STACK_SAMPLE_INTERVAL = 0.1
+
+# Version of the persistent session protocol, sent back on "session"
+SESSION_PROTOCOL = 1
+
+# Isolation levels of the "run_many" command
+ISOLATION_LEVELS = ("item", "benchmark")
+
+# Default cap on the output reported per benchmark (the tail is kept)
+DEFAULT_OUTPUT_LIMIT = 4 * 1024 * 1024
+
+# Initial size of output buffers, and read size for framed output
+_PIPE_CHUNK = 64 * 1024
+
+# Memory figures of a child, read from /proc/<pid>/smaps_rollup by the child
+# itself right before it exits (the file is gone once it is a zombie)
+_SMAPS_ROLLUP = "/proc/self/smaps_rollup"
+_SMAPS_FIELDS = (b"Private_Clean", b"Private_Dirty", b"Pss")
+_MEMORY_REPORT = struct.Struct("<3q")
+
+# Number of timing samples a child can leave behind for a timeout report
+_SAMPLE_RING_CAPACITY = 4096
+
+# Errors raised by `_Server._handle` for a malformed command
+_COMMAND_ERRORS = (AttributeError, KeyError, RuntimeError, TypeError, ValueError)
+
+_RUN_KEYS = (
+    "benchmark_id",
+    "params_str",
+    "profile_path",
+    "result_file",
+    "timeout",
+    "cwd",
+)
+
+
+def _stack_sample_signal():
+    """
+    Returns the signal asking a child to dump its stacks, or None where the
+    platform does not have it; `stack_sample_time` is then ignored.
+    """
+    return getattr(signal, _STACK_SAMPLE_SIGNAL, None)
+
+
+def _parse_run_command(command):
+    """
+    Validates a `run` command.
+
+    #### Parameters
+    **command** (`dict`)
+    : The command, with the `action` and `request_id` keys already removed.
+
+    #### Returns
+    **run_command** (`dict`)
+    : The keys of the command needed to spawn the benchmark. The optional
+    `output_limit` key (bytes of output reported) defaults to
+    `DEFAULT_OUTPUT_LIMIT`, `stack_dump` (dump the stacks of the child when it
+    times out) to True and `stack_sample_time` (seconds before the timeout
+    during which the stacks are dumped periodically) to 0, and is always 0
+    where the stacks cannot be requested; see `_stack_sample_signal`.
+
+    #### Raises
+    **RuntimeError**
+    : If the command contains unknown data.
+    """
+    run_command = {key: command.pop(key) for key in _RUN_KEYS}
+    run_command["output_limit"] = int(command.pop("output_limit", DEFAULT_OUTPUT_LIMIT))
+    run_command["stack_dump"] = bool(command.pop("stack_dump", True))
+    run_command["stack_sample_time"] = float(command.pop("stack_sample_time", 0))
+    if _stack_sample_signal() is None:
+        run_command["stack_sample_time"] = 0.0
+    if command:
+        raise RuntimeError(f"Command contained unknown data: {command!r}")
+    return run_command
+
+
+def _partition_cpus(workers):
+    """
+    Splits the CPUs available to the server into disjoint sets, one per worker.
+
+    #### Parameters
+    **workers** (`int`)
+    : The number of concurrent benchmark children.
+
+    #### Returns
+    **cpu_sets** (`list`)
+    : A list of length `workers`. Each entry is a list of CPU numbers the
+    corresponding worker slot is pinned to, or `None` if the slot is not pinned.
+
+    #### Notes
+    With a single worker nothing is pinned, which keeps the historical
+    behaviour of the server. When the CPU set cannot be queried, or there are
+    fewer CPUs than workers, the slots without a CPU of their own are left
+    unpinned.
+    """
+    if workers == 1 or not hasattr(os, "sched_getaffinity"):
+        return [None] * workers
+    cpus = sorted(os.sched_getaffinity(0))
+    cpu_sets = []
+    for k in range(workers):
+        chunk = cpus[k * len(cpus) // workers : (k + 1) * len(cpus) // workers]
+        cpu_sets.append(chunk or None)
+    return cpu_sets
+
+
+class _OutputBuffer:
+    """
+    Bounded buffer for the output of a benchmark.
+
+    #### Parameters
+    **limit** (`int`)
+    : The maximum number of bytes kept.
+
+    #### Notes
+    The buffer grows geometrically up to `limit` and then turns into a ring
+    that keeps the last `limit` bytes, counting the bytes it overwrites. Data
+    is read from the pipe straight into the buffer with `os.readv`, without
+    intermediate `bytes` objects.
+    """
+
+    def __init__(self, limit):
+        self.limit = max(limit, 1)
+        self.buf = bytearray(min(self.limit, _PIPE_CHUNK))
+        self.size = 0
+        self.pos = 0
+        self.dropped = 0
+
+    def _space(self):
+        """Returns the offset and length of the next writable region."""
+        if self.size == len(self.buf) < self.limit:
+            self.buf += bytes(min(len(self.buf), self.limit - len(self.buf)))
+        if self.size < len(self.buf):
+            return self.size, len(self.buf) - self.size
+        return self.pos, len(self.buf) - self.pos
+
+    def _commit(self, n):
+        """Accounts for `n` bytes written at the offset given by `_space`."""
+        if self.size < len(self.buf):
+            self.size += n
+        else:
+            self.dropped += n
+            self.pos = (self.pos + n) % len(self.buf)
+
+    def read_from(self, fd):
+        """
+        Reads the data available on a non-blocking file descriptor.
+
+        #### Returns
+        **more** (`bool`)
+        : False once the end of file has been reached.
+        """
+        while True:
+            offset, length = self._space()
+            try:
+                with memoryview(self.buf) as view:
+                    n = os.readv(fd, [view[offset : offset + length]])
+            except BlockingIOError:
+                return True
+            if not n:
+                return False
+            self._commit(n)
+
+    def write(self, data):
+        """Appends `data` to the buffer."""
+        with memoryview(data) as view:
+            while view:
+                offset, length = self._space()
+                n = min(length, len(view))
+                self.buf[offset : offset + n] = view[:n]
+                self._commit(n)
+                view = view[n:]
+
+    def getvalue(self):
+        """
+        Returns the buffered output, decoded, prefixed by a marker if the
+        beginning had to be dropped.
+        """
+        if not self.dropped:
+            with memoryview(self.buf) as view:
+                return str(view[: self.size], "utf-8", "replace")
+        data = self.buf[self.pos :] + self.buf[: self.pos]
+        header = f"[asv: {self.dropped} bytes of output truncated]\n"
+        return header + data.decode("utf-8", "replace")
+
+
+class _FramedOutput:
+    """
+    Splits the output of a child running several benchmarks.
+
+    #### Parameters
+    **marker** (`bytes`)
+    : The job-specific token the child writes, followed by the exit code of
+    the benchmark and a newline, after the output of every benchmark.
+
+    **limits** (`list` of `int`)
+    : The output limit of every benchmark, in order.
+
+    #### Attributes
+    **results** (`list`)
+    : One `(out, exitcode)` pair per finished benchmark.
+    """
+
+    def __init__(self, marker, limits):
+        self.marker = marker
+        self.limits = list(limits)
+        self.results = []
+        self.current = _OutputBuffer(self.limits[0])
+        self.pending = bytearray()
+
+    def read_from(self, fd):
+        """Reads the data available on a non-blocking file descriptor;
+        returns False once the end of file has been reached."""
+        while True:
+            try:
+                data = os.read(fd, _PIPE_CHUNK)
+            except BlockingIOError:
+                return True
+            if not data:
+                self.current.write(self.pending)
+                self.pending = bytearray()
+                return False
+            self.pending += data
+            self._split()
+
+    def _split(self):
+        """Moves complete benchmark outputs from `pending` to `results`."""
+        while True:
+            start = self.pending.find(self.marker)
+            if start < 0:
+                # Hold back what could be the beginning of a marker
+                keep = len(self.marker) + 24
+                if len(self.pending) > keep:
+                    self.current.write(self.pending[:-keep])
+                    del self.pending[:-keep]
+                return
+            end = self.pending.find(b"\n", start + len(self.marker))
+            self.current.write(self.pending[:start])
+            del self.pending[:start]
+            if end < 0:
+                return
+            exitcode = int(self.pending[len(self.marker) : end - start])
+            del self.pending[: end - start + 1]
+            self.results.append((self.current.getvalue(), exitcode))
+            limit = self.limits[min(len(self.results), len(self.limits) - 1)]
+            self.current = _OutputBuffer(limit)
+
+
+class _SampleRing:
+    """
+    Ring of timing samples in memory shared with the benchmark children.
+
+    #### Parameters
+    **capacity** (`int`)
+    : The number of most recent samples kept.
+
+    #### Notes
+    A child passes `append` to `set_sample_callback`, so every sample taken by
+    `TimeBenchmark.benchmark_timing` is stored in an anonymous shared mapping
+    inherited across `fork`. If the child is killed on timeout, the server can
+    still report the samples collected so far. The header holds the number of
+    samples written so far and the `number` of executions per sample.
+    """
+
+    _HEADER = struct.Struct("<QQ")
+    _SAMPLE = struct.Struct("<d")
+
+    def __init__(self, capacity=_SAMPLE_RING_CAPACITY):
+        self.capacity = capacity
+        self.map = mmap.mmap(-1, self._HEADER.size + capacity * self._SAMPLE.size)
+
+    def reset(self):
+        """Discards the stored samples."""
+        self._HEADER.pack_into(self.map, 0, 0, 0)
+
+    def append(self, timing, number):
+        """Stores the total time of `number` executions of a benchmark."""
+        count, _ = self._HEADER.unpack_from(self.map, 0)
+        offset = self._HEADER.size + (count % self.capacity) * self._SAMPLE.size
+        self._SAMPLE.pack_into(self.map, offset, timing)
+        self._HEADER.pack_into(self.map, 0, count + 1, number)
+
+    def get_result(self):
+        """
+        Returns the stored samples as a partial benchmark result.
+
+        #### Returns
+        **result** (`dict` or None)
+        : The samples (time per execution, oldest first) and `number`, as
+        returned by `TimeBenchmark.run`, or None if there are none.
+        """
+        count, number = self._HEADER.unpack_from(self.map, 0)
+        if count == 0:
+            return None
+        start = max(count - self.capacity, 0)
+        samples = []
+        for i in range(start, count):
+            offset = self._HEADER.size + (i % self.capacity) * self._SAMPLE.size
+            (timing,) = self._SAMPLE.unpack_from(self.map, offset)
+            samples.append(timing / number)
+        return {"samples": samples, "number": number}
+
+    def close(self):
+        self.map.close()
+
+
+class _Job:
+    """
+    A forked benchmark child in flight on the server.
+
+    #### Attributes
+    **client** (`_Client`)
+    : The client connection waiting for the result.
+
+    **request_id** (`object`)
+    : The id the result is tagged with on a session connection, or None.
+
+    **pid** (`int`)
+    : The process id of the child.
+
+    **slot** (`int`)
+    : The worker slot occupied by the child.
+
+    **indices** (`list`)
+    : The position in their "run_many" command of the benchmarks run by the
+    child, or `[None]` for a "run" command.
+
+    **output** (`_OutputBuffer` or `_FramedOutput`)
+    : The output captured from the child.
+
+    **replied** (`int`)
+    : The number of benchmarks of the child already answered, in order.
+
+    **output_fd** (`int` or None)
+    : The read end of the pipe the child output is redirected to, until the
+    end of file has been read.
+
+    **timeout** (`float` or None)
+    : The wall time after which the child is terminated.
+
+    **start_time** (`float`)
+    : The wall time at which the child was spawned.
+
+    **kill_delay** (`float`)
+    : The time between `SIGTERM` and `SIGKILL` once the timeout has passed.
+
+    **next_sample** (`float` or None)
+    : The wall time at which the child is next asked to dump its stacks before
+    its timeout, or None.
+
+    **is_timeout** (`bool`)
+    : Whether the child has already been signalled for exceeding the timeout.
+
+    **pidfd** (`int` or None)
+    : A process file descriptor that becomes readable when the child exits, if
+    the platform supports it.
+    """
+
+    def __init__(
+        self,
+        client,
+        request_id,
+        pid,
+        slot,
+        indices,
+        output,
+        output_fd,
+        timeout,
+        kill_delay=_SIGKILL_DELAY,
+        sample_time=0.0,
+    ):
+        self.client = client
+        self.request_id = request_id
+        self.pid = pid
+        self.slot = slot
+        self.indices = indices
+        self.output = output
+        self.replied = 0
+        self.output_fd = output_fd
+        self.timeout = timeout
+        self.kill_delay = kill_delay
+        self.start_time = wall_timer()
+        self.next_sample = None
+        if timeout is not None and sample_time > 0:
+            self.next_sample = self.start_time + max(timeout - sample_time, 0.0)
+        self.is_timeout = False
+        self.pidfd = _open_pidfd(pid)
+
+    def deadline(self):
+        """
+        Returns the wall time at which the child has to be signalled next, or
+        None if it has no timeout.
+        """
+        if self.timeout is None:
+            return None
+        if self.is_timeout:
+            return self.start_time + self.timeout + self.kill_delay
+        if self.next_sample is not None:
+            return min(self.next_sample, self.start_time + self.timeout)
+        return self.start_time + self.timeout
+
+    def check_timeout(self, now):
+        """
+        Signals the child if it ran past its timeout: first `SIGTERM`, then
+        `SIGKILL` once `kill_delay` has passed as well. Before the timeout, asks
+        the child for its stacks every `_STACK_SAMPLE_INTERVAL` once
+        `next_sample` has come.
+
+        #### Parameters
+        **now** (`float`)
+        : The current wall time.
+        """
+        deadline = self.deadline()
+        if deadline is None or now < deadline:
+            return
+        if self.is_timeout:
+            os.kill(self.pid, signal.SIGKILL)
+        elif now >= self.start_time + self.timeout:
+            os.kill(self.pid, signal.SIGTERM)
+            self.is_timeout = True
+        else:
+            os.kill(self.pid, _stack_sample_signal())
+            self.next_sample = max(self.next_sample + _STACK_SAMPLE_INTERVAL, now)
+
+    def close_output(self):
+        """Closes the read end of the output pipe."""
+        if self.output_fd is not None:
+            os.close(self.output_fd)
+            self.output_fd = None
+
+    def close(self):
+        """Releases the file descriptors of the job."""
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+        self.close_output()
+
+
+def _open_pidfd(pid):
+    """
+    Opens a process file descriptor for a child.
+
+    #### Parameters
+    **pid** (`int`)
+    : The process id of the child.
+
+    #### Returns
+    **pidfd** (`int` or None)
+    : A file descriptor that becomes readable when the child exits, or None
+    where `os.pidfd_open` is not available (Python < 3.9, Linux < 5.3, other
+    platforms).
+    """
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+class _ChildExitPipe:
+    """
+    Self-pipe that becomes readable whenever a child process exits.
+
+    Fallback for platforms without process file descriptors: a `SIGCHLD`
+    handler is installed and `signal.set_wakeup_fd` makes the interpreter write
+    to the pipe when the signal arrives, so the server can wait for child exits
+    in the same `selectors` call as for new connections.
+    """
+
+    def __init__(self):
+        self._rfd, self._wfd = os.pipe()
+        os.set_blocking(self._rfd, False)
+        os.set_blocking(self._wfd, False)
+        self._old_handler = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self._old_wakeup_fd = signal.set_wakeup_fd(self._wfd)
+
+    def fileno(self):
+        return self._rfd
+
+    def drain(self):
+        """Consumes the pending wakeup bytes."""
+        try:
+            while os.read(self._rfd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        """Restores the previous signal state and closes the pipe."""
+        signal.set_wakeup_fd(self._old_wakeup_fd)
+        signal.signal(signal.SIGCHLD, self._old_handler)
+        os.close(self._rfd)
+        os.close(self._wfd)
+
+
+def _exit_status_to_retcode(status):
+    """
+    Converts a `waitpid` status into a `subprocess`-style return code.
+
+    #### Parameters
+    **status** (`int`)
+    : The status returned by `os.waitpid`.
+
+    #### Returns
+    **retcode** (`int`)
+    : The exit code, or the negated signal number if the child was signalled.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    elif os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    elif os.WIFSTOPPED(status):
+        return -os.WSTOPSIG(status)
+    else:
+        # shouldn't happen, but fail silently
+        return -128
+
+
+def _rusage_to_dict(rusage):
+    """
+    Converts the resource usage of a child into a JSON-serializable dict.
+
+    #### Parameters
+    **rusage** (`resource.struct_rusage`)
+    : The resource usage returned by `os.wait4`.
+
+    #### Returns
+    **info** (`dict`)
+    : The user and system CPU time in seconds, the peak resident set size in
+    bytes, the minor and major page faults and the voluntary and involuntary
+    context switches of the child.
+    """
+    # OSX reports maxrss in bytes, Linux and *BSD in kilobytes
+    maxrss_scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "utime": rusage.ru_utime,
+        "stime": rusage.ru_stime,
+        "maxrss": rusage.ru_maxrss * maxrss_scale,
+        "minflt": rusage.ru_minflt,
+        "majflt": rusage.ru_majflt,
+        "nvcsw": rusage.ru_nvcsw,
+        "nivcsw": rusage.ru_nivcsw,
+    }
+
+
+def _write_memory_report(memory_report):
+    """
+    Stores the private and proportional memory of the calling process.
+
+    #### Parameters
+    **memory_report** (`mmap.mmap`)
+    : The shared mapping the figures are written to, as `_MEMORY_REPORT`
+    values in bytes. It is left untouched if `/proc/self/smaps_rollup` cannot
+    be read.
+    """
+    values = dict.fromkeys(_SMAPS_FIELDS, -1)
+    try:
+        with open(_SMAPS_ROLLUP, "rb") as fp:
+            for line in fp:
+                key, _, value = line.partition(b":")
+                if key in values:
+                    values[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        return
+    _MEMORY_REPORT.pack_into(memory_report, 0, *values.values())
+
+
+def _read_memory_report(memory_report):
+    """
+    Reads, and resets, the figures stored by `_write_memory_report`.
+
+    #### Parameters
+    **memory_report** (`mmap.mmap`)
+    : The shared mapping of the worker slot.
+
+    #### Returns
+    **memory** (`dict` or None)
+    : The `private_clean`, `private_dirty` and `pss` memory of the child in
+    bytes, or None if the child did not report them.
+    """
+    values = _MEMORY_REPORT.unpack_from(memory_report, 0)
+    _MEMORY_REPORT.pack_into(memory_report, 0, -1, -1, -1)
+    if values[0] < 0:
+        return None
+    return dict(zip(("private_clean", "private_dirty", "pss"), values))
+
+
+def _spawn_benchmark(
+    benchmark_dir,
+    commands,
+    output_fd,
+    marker,
+    cpu_set,
+    close_fds,
+    memory_report=None,
+    benchmarks=None,
+    setup_caches=None,
+    sample_ring=None,
+):
+    """
+    Forks a child process that runs one or several benchmarks.
+
+    #### Parameters
+    **benchmark_dir** (`str`)
+    : The directory where the benchmarks are located.
+
+    **commands** (`list`)
+    : The parsed `run` commands of the benchmarks.
+
+    **output_fd** (`int`)
+    : The write end of the pipe the child output is redirected to.
+
+    **marker** (`bytes` or None)
+    : Required when there are several commands: the token written to the
+    output, followed by the exit code and a newline, after each benchmark.
+
+    **cpu_set** (`list` or None)
+    : The CPUs the child is pinned to, or None to inherit the server affinity.
+    An explicit `cpu_affinity` in the benchmark parameters still takes
+    precedence, since `_run_benchmark` applies it afterwards.
+
+    **close_fds** (`list`)
+    : Objects owned by the server (sockets, jobs, the child exit pipe) that the
+    child should close.
+
+    **memory_report** (`mmap.mmap`, optional)
+    : A shared mapping the child stores its memory figures in right before it
+    exits, see `_write_memory_report`.
+
+    **benchmarks** (`dict`, optional)
+    : The index of preimported `Benchmark` objects by name, see
+    `_run_benchmark`.
+
+    **setup_caches** (`dict`, optional)
+    : Setup caches already unpickled by the server, see `_run_benchmark`.
+
+    **sample_ring** (`_SampleRing`, optional)
+    : The ring the timing samples of the benchmark being run are stored in,
+    reset before each benchmark.
+
+    #### Returns
+    **pid** (`int`)
+    : The process id of the child.
+
+    #### Notes
+    A single benchmark is run exactly as by the `run` command: the whole child
+    output goes to the pipe and the exit code of the child is the result.
+
+    Unless disabled with `stack_dump`, `faulthandler` writes the stacks of all
+    threads to the output when the child receives `SIGTERM`, before it dies.
+    With `stack_sample_time`, it does so on every `_STACK_SAMPLE_SIGNAL` too;
+    that signal is blocked by the caller around the `fork` and only unblocked
+    in the child once the handler is in place. With
+    several benchmarks the child imports the suite and loads every setup cache
+    once, runs the benchmarks one after another, and separates their output
+    with the marker.
+    """
+    sample_signal = _stack_sample_signal()
+    blocked = [] if sample_signal is None else [sample_signal]
+    signal.pthread_sigmask(signal.SIG_BLOCK, blocked)
+    try:
+        pid = os.fork()
+    except BaseException:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, blocked)
+        raise
+    if pid == 0:
+        for obj in close_fds:
+            obj.close()
+        sys.stdin.close()
+        if sample_ring is not None:
+            set_sample_callback(sample_ring.append)
+        exitcode = 1
+        try:
+            with posix_redirect_output(output_fd, permanent=True):
+                os.close(output_fd)
+                if any(command["stack_dump"] for command in commands):
+                    faulthandler.register(signal.SIGTERM, chain=True)
+                if any(command["stack_sample_time"] > 0 for command in commands):
+                    faulthandler.register(sample_signal)
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, blocked)
+                if len(commands) == 1:
+                    (command,) = commands
+                    try:
+                        if cpu_set is not None:
+                            set_cpu_affinity(cpu_set)
+                        os.chdir(command["cwd"])
+                        _run_benchmark(
+                            *_run_args(benchmark_dir, command),
+                            setup_caches=setup_caches,
+                            benchmarks=benchmarks,
+                        )
+                        exitcode = 0
+                    except BaseException:
+                        import traceback
+
+                        traceback.print_exc()
+                else:
+                    if cpu_set is not None:
+                        set_cpu_affinity(cpu_set)
+                    if setup_caches is None:
+                        setup_caches = {}
+                    for command in commands:
+                        if sample_ring is not None:
+                            sample_ring.reset()
+                        item_exitcode = 1
+                        try:
+                            os.chdir(command["cwd"])
+                            _run_benchmark(
+                                *_run_args(benchmark_dir, command),
+                                setup_caches=setup_caches,
+                                benchmarks=benchmarks,
+                            )
+                            item_exitcode = 0
+                        except BaseException:
+                            import traceback
+
+                            traceback.print_exc()
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+                        os.write(1, marker + b"%d\n" % item_exitcode)
+                    exitcode = 0
+        finally:
+            if memory_report is not None:
+                _write_memory_report(memory_report)
+            os._exit(exitcode)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, blocked)
+    return pid
+
+
+def _run_args(benchmark_dir, command):
+    """Returns the `_run` arguments of a parsed `run` command."""
+    return (
+        benchmark_dir,
+        command["benchmark_id"],
+        command["params_str"],
+        command["profile_path"],
+        command["result_file"],
+    )
+
+
+def _group_items(items, isolation):
     """
-    Receives data from a socket until the specified size of data has been received.
+    Splits the items of a "run_many" command into the groups run by one child.
 
     #### Parameters
-    **sock** (`socket`)
-    : The socket from which the data will be received. This socket should
-    already be connected to the other end from which data is to be received.
+    **items** (`list`)
+    : The parsed `run` commands.
 
-    **size** (`int`)
-    : The total size of data to be received from the socket.
+    **isolation** (`str`)
+    : "item" for one child per item, "benchmark" for one child per benchmark
+    (all parameter combinations of a benchmark that share a working
+    directory, and hence a setup cache).
 
     #### Returns
-    **data** (`bytes`)
-    : The data received from the socket. The length of this data will be equal
-    to the size specified.
+    **groups** (`list`)
+    : Lists of `(index, command)` pairs, in order of first appearance.
 
     #### Raises
     **RuntimeError**
-    : If the socket closed before the specified size of data could be received.
+    : If the isolation level is unknown.
+    """
+    if isolation not in ISOLATION_LEVELS:
+        raise RuntimeError(f"Unknown isolation level: {isolation!r}")
+    if isolation == "item":
+        return [[(index, command)] for index, command in enumerate(items)]
+    groups = {}
+    for index, command in enumerate(items):
+        key = (command["benchmark_id"].split("-", 1)[0], command["cwd"])
+        groups.setdefault(key, []).append((index, command))
+    return list(groups.values())
+
+
+class _FileDescriptor:
+    """Closable wrapper of a raw file descriptor, for `close_fds`."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _read_output(stdout_file):
+    """
+    Reads the captured output of a command and removes the file.
+
+    #### Parameters
+    **stdout_file** (`str`)
+    : The file the output was redirected to.
+
+    #### Returns
+    **out** (`str`)
+    : The captured output.
+    """
+    try:
+        with open(stdout_file, errors="replace") as f:
+            return f.read()
+    finally:
+        # Parent may deliver SIGINT during teardown (asv#1511); do not let
+        # cleanup raise KeyboardInterrupt and spam the benchmark log.
+        try:
+            os.unlink(stdout_file)
+        except (KeyboardInterrupt, OSError):
+            pass
+
+
+class _Client:
+    """
+    A connection to the server.
+
+    #### Attributes
+    **conn** (`socket`)
+    : The connected socket.
+
+    **persistent** (`bool`)
+    : Whether the connection is a session that carries many tagged commands,
+    or a one-shot connection closed after its single reply.
+
+    **input** (`bytearray`)
+    : The data received from the client that does not make a whole message
+    yet.
+
+    **in_flight** (`int`)
+    : The number of commands of this client that are still to be answered.
+
+    **eof** (`bool`)
+    : Whether the client will not send any further commands: it closed its
+    end, or it is a one-shot connection whose command has been received.
+
+    **output** (`bytearray`)
+    : The messages queued for the client that the socket did not accept yet.
+
+    **lost** (`bool`)
+    : Whether the client went away; messages to it are dropped.
+
+    **events** (`int`)
+    : The selector events the connection is registered for, or 0 if it is
+    not registered.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.persistent = False
+        self.input = bytearray()
+        self.in_flight = 0
+        self.eof = False
+        self.output = bytearray()
+        self.lost = False
+        self.events = 0
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def receive(self):
+        """
+        Reads the data available on the non-blocking socket, and returns the
+        whole messages received so far.
+
+        #### Returns
+        **messages** (`list` of `bytes`)
+        : The JSON payloads of the length-prefixed messages, in order. An
+        incomplete message is kept until the rest of it arrives.
+        """
+        try:
+            data = self.conn.recv(_PIPE_CHUNK)
+        except BlockingIOError:
+            return []
+        except OSError:
+            data = b""
+        if not data:
+            # Closed its end: what is in flight is still answered
+            self.eof = True
+            return []
+        self.input += data
+        messages = []
+        while len(self.input) >= 8:
+            (size,) = struct.unpack_from("<Q", self.input)
+            if len(self.input) < 8 + size:
+                break
+            messages.append(bytes(self.input[8 : 8 + size]))
+            del self.input[: 8 + size]
+        return messages
+
+    def send(self, obj):
+        """
+        Queues a length-prefixed JSON message, and sends what the socket
+        accepts right away; see `flush`.
+        """
+        if self.lost:
+            return
+        data = json.dumps(obj).encode("utf-8")
+        self.output += struct.pack("<Q", len(data))
+        self.output += data
+        self.flush()
+
+    def flush(self):
+        """
+        Sends as much of the queued output as the non-blocking socket accepts.
+
+        The server never waits for a client to read: the rest is sent once the
+        socket is writable again. A client that went away does not bring the
+        server down; its pending output is dropped.
+        """
+        try:
+            while self.output:
+                n = self.conn.send(self.output)
+                del self.output[:n]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.output = bytearray()
+            self.lost = True
+            self.eof = True
+
+    def reply(self, request_id, info):
+        """Sends the reply to a command, tagged with `request_id` on a session."""
+        if self.persistent:
+            info = {"request_id": request_id, **info}
+        self.send(info)
+        self.in_flight -= 1
+
+    def done(self):
+        """Whether the connection can be closed."""
+        return self.in_flight == 0 and not self.output and self.eof
+
+    def close(self):
+        # Parent may deliver SIGINT during teardown (asv#1511); do not let
+        # cleanup raise KeyboardInterrupt and spam the benchmark log.
+        try:
+            self.conn.close()
+        except KeyboardInterrupt:
+            pass
+
+
+class _Server:
+    """
+    Event loop of the benchmark fork server.
+
+    #### Parameters
+    **benchmark_dir** (`str`)
+    : The directory where the benchmarks are located.
+
+    **listener** (`socket`)
+    : The listening UNIX socket.
+
+    **workers** (`int`)
+    : The maximum number of benchmark children running at the same time.
 
     #### Notes
-    This function continuously receives data from the provided socket in a loop
-    until the total length of the received data is equal to the specified size.
-    If the socket closes before the specified size of data could be received, a
-    `RuntimeError` is raised. The function returns the received data as a byte
-    string.
-    """
-    data = b""
-    while len(data) < size:
-        s = sock.recv(size - len(data))
-        data += s
-        if not s:
-            raise RuntimeError(
-                f"did not receive data from socket (size {size}, got only {data!r})"
+    Every file descriptor the server waits on is registered with a selector,
+    with a callback as its data: the listening socket, the client
+    connections, the process file descriptor of every running child and, on
+    platforms without process file descriptors, a `SIGCHLD` self-pipe. The
+    callbacks are called with the mask of the ready events. The selector
+    timeout is the earliest pending benchmark deadline.
+
+    Client sockets are non-blocking. Commands are buffered on their client
+    until a whole message has arrived, and replies are queued on it and
+    written as the socket accepts them; a connection is registered for
+    `EVENT_READ` while commands may still arrive on it and for `EVENT_WRITE`
+    while it has output pending, so a client that sends or reads slowly holds
+    up no one else.
+
+    `run` commands wait in a FIFO queue until a worker slot is free.
+    """
+
+    def __init__(self, benchmark_dir, listener, workers):
+        self.benchmark_dir = benchmark_dir
+        self.listener = listener
+        self.cpu_sets = _partition_cpus(workers)
+        self.free_slots = list(range(workers))[::-1]
+        self.benchmarks = None
+        self.setup_caches = None
+        self.setup_cache_stamps = {}
+        self.frozen = False
+        if os.path.exists(_SMAPS_ROLLUP):
+            self.memory_reports = []
+            for _ in range(workers):
+                memory_report = mmap.mmap(-1, _MEMORY_REPORT.size)
+                _MEMORY_REPORT.pack_into(memory_report, 0, -1, -1, -1)
+                self.memory_reports.append(memory_report)
+        else:
+            self.memory_reports = None
+        self.sample_rings = [_SampleRing() for _ in range(workers)]
+        self.jobs = {}
+        self.queue = collections.deque()
+        self.clients = set()
+        self.quitting = False
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(
+            listener, selectors.EVENT_READ, lambda mask: self._accept()
+        )
+
+        probe = _open_pidfd(os.getpid())
+        if probe is None:
+            self.exit_pipe = _ChildExitPipe()
+            self.selector.register(
+                self.exit_pipe, selectors.EVENT_READ, lambda mask: self._reap_all()
             )
-    return data
+        else:
+            os.close(probe)
+            self.exit_pipe = None
+
+    def serve(self):
+        """Handles commands until a "quit" command has been received and all
+        commands received before it have been answered."""
+        while not (
+            self.quitting
+            and not self.jobs
+            and not self.queue
+            and not any(client.output for client in self.clients)
+        ):
+            for key, mask in self.selector.select(self._select_timeout()):
+                key.data(mask)
+
+            now = wall_timer()
+            for job in list(self.jobs.values()):
+                job.check_timeout(now)
+
+            while self.queue and self.free_slots:
+                self._spawn(*self.queue.popleft())
+
+            for client in list(self.clients):
+                self._update_client(client)
+
+    def _select_timeout(self):
+        """Returns the time until the earliest pending job deadline."""
+        deadlines = [job.deadline() for job in self.jobs.values()]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - wall_timer())
+
+    def _accept(self):
+        """Accepts a connection; its commands are read as they arrive."""
+        conn, addr = self.listener.accept()
+        conn.setblocking(False)
+        self.clients.add(_Client(conn))
+
+    def _client_ready(self, client, mask):
+        """Sends the pending output of a client, and reads its commands."""
+        if mask & selectors.EVENT_WRITE:
+            client.flush()
+        if mask & selectors.EVENT_READ and not client.eof:
+            self._read_commands(client)
+
+    def _read_commands(self, client):
+        """
+        Acts on the commands a client has sent in full so far.
+
+        A one-shot connection carries a single command, unless it turns into a
+        session; whatever follows it is ignored.
+        """
+        for message in client.receive():
+            if client.eof:
+                return
+            try:
+                command = json.loads(message.decode("utf-8"))
+            except ValueError as exc:
+                self._reject(client, None, exc)
+                return
+            self._dispatch(client, command)
+            if not client.persistent:
+                client.eof = True
+
+    def _dispatch(self, client, command):
+        """Acts on a command, rejecting it if it is malformed; see `_reject`."""
+        request_id = command.get("request_id") if isinstance(command, dict) else None
+        try:
+            self._handle(client, command)
+        except _COMMAND_ERRORS as exc:
+            self._reject(client, request_id, exc)
+
+    def _reject(self, client, request_id, exc):
+        """
+        Answers a malformed command with an error, and stops reading from its
+        connection.
+
+        The commands of the client already in flight are still answered before
+        the connection is closed; other clients are not affected.
+
+        #### Parameters
+        **client** (`_Client`)
+        : The connection the command was received on.
+
+        **request_id** (`object`)
+        : The id of the command, if it could be read, for the reply on a
+        session.
+
+        **exc** (`Exception`)
+        : The error the command raised.
+        """
+        info = {"error": f"Invalid command: {type(exc).__name__}: {exc}"}
+        if client.persistent:
+            info = {"request_id": request_id, **info}
+        client.send(info)
+        client.eof = True
+
+    def _handle(self, client, command):
+        """
+        Acts on a command.
+
+        #### Parameters
+        **client** (`_Client`)
+        : The connection the command was received on.
+
+        **command** (`dict`)
+        : The decoded command.
+
+        #### Raises
+        **RuntimeError**, **KeyError**, **TypeError**, **ValueError**
+        : If the command is malformed. It is then rejected as a whole, before
+        any state is changed.
+        """
+        action = command.pop("action")
+        request_id = command.pop("request_id", None)
+
+        if action == "quit":
+            if self.quitting:
+                return
+            self.quitting = True
+            self.selector.unregister(self.listener)
+            for other in self.clients:
+                other.eof = True
+            return
+        elif action == "session":
+            if client.persistent:
+                raise RuntimeError("Connection is already a session")
+            client.persistent = True
+            client.send({"protocol": SESSION_PROTOCOL})
+            return
+
+        if action == "preimport":
+            # Import benchmark suite before forking.
+            # Capture I/O to a file during import.
+            freeze = command.pop("freeze", False)
+            setup_caches = command.pop("setup_caches", False)
+            fd, stdout_file = tempfile.mkstemp()
+            os.close(fd)
+            benchmarks = {}
+            with posix_redirect_output(stdout_file, permanent=False):
+                for benchmark in disc_benchmarks(
+                    self.benchmark_dir, ignore_import_errors=True
+                ):
+                    benchmarks[benchmark.name] = benchmark
+            self.benchmarks = benchmarks
+            if setup_caches and self.setup_caches is None:
+                self.setup_caches = {}
+            if freeze:
+                self.frozen = True
+                # Move the imported heap out of reach of the cyclic GC, so the
+                # children do not copy its pages by touching object headers
+                gc.collect()
+                gc.freeze()
+
+            # Report result
+            out = _read_output(stdout_file)
+            client.in_flight += 1
+            client.reply(request_id, {"out": out} if client.persistent else out)
+            return
+        elif action == "run_many":
+            isolation = command.pop("isolation", "item")
+            items = []
+            for item in command.pop("items"):
+                # Items may be complete "run" commands
+                item = dict(item)
+                item.pop("action", None)
+                items.append(_parse_run_command(item))
+            if command:
+                raise RuntimeError(f"Command contained unknown data: {command!r}")
+            groups = _group_items(items, isolation)
+            client.in_flight += len(items)
+            for group in groups:
+                self.queue.append((client, request_id, group))
+            return
+
+        command = _parse_run_command(command)
+        client.in_flight += 1
+        self.queue.append((client, request_id, [(None, command)]))
+
+    def _spawn(self, client, request_id, group):
+        """Forks a benchmark child for a group of `(index, command)` pairs into
+        a free worker slot."""
+        commands = [command for _, command in group]
+        limits = [command["output_limit"] for command in commands]
+        if len(commands) == 1:
+            marker = None
+            output = _OutputBuffer(limits[0])
+        else:
+            marker = b"\0asv-" + os.urandom(8).hex().encode("ascii") + b":"
+            output = _FramedOutput(marker, limits)
+
+        timeouts = [command["timeout"] for command in commands]
+        timeout = None if None in timeouts else sum(timeouts)
+
+        slot = self.free_slots.pop()
+        close_fds = [self.listener] + list(self.clients) + list(self.jobs.values())
+        if self.exit_pipe is not None:
+            close_fds.append(self.exit_pipe)
+        memory_report = None
+        if self.memory_reports is not None:
+            memory_report = self.memory_reports[slot]
+        sample_ring = self.sample_rings[slot]
+        sample_ring.reset()
+        output_r, output_w = os.pipe()
+        try:
+            pid = _spawn_benchmark(
+                self.benchmark_dir,
+                commands,
+                output_w,
+                marker,
+                self.cpu_sets[slot],
+                close_fds + [_FileDescriptor(output_r)],
+                memory_report,
+                self.benchmarks,
+                self._load_setup_caches(commands),
+                sample_ring,
+            )
+        finally:
+            os.close(output_w)
+        os.set_blocking(output_r, False)
+
+        indices = [index for index, _ in group]
+        stack_dump = any(command["stack_dump"] for command in commands)
+        job = _Job(
+            client,
+            request_id,
+            pid,
+            slot,
+            indices,
+            output,
+            output_r,
+            timeout,
+            kill_delay=_STACK_DUMP_KILL_DELAY if stack_dump else _SIGKILL_DELAY,
+            sample_time=max(command["stack_sample_time"] for command in commands),
+        )
+        self.jobs[pid] = job
+        self.selector.register(
+            output_r, selectors.EVENT_READ, lambda mask: self._drain(job)
+        )
+        if job.pidfd is not None:
+            self.selector.register(
+                job.pidfd, selectors.EVENT_READ, lambda mask: self._reap(job)
+            )
+        elif self.exit_pipe is None:
+            # pidfd_open failed for this child only; fall back to SIGCHLD
+            self.exit_pipe = _ChildExitPipe()
+            self.selector.register(
+                self.exit_pipe, selectors.EVENT_READ, lambda mask: self._reap_all()
+            )
+            self._reap_all()
+
+    def _load_setup_caches(self, commands):
+        """
+        Unpickles, in the server, the setup caches the commands will use.
+
+        #### Parameters
+        **commands** (`list`)
+        : The parsed `run` commands about to be spawned.
+
+        #### Returns
+        **setup_caches** (`dict` or None)
+        : The setup caches by the absolute path of their pickle file, as
+        expected by `_run_benchmark`, or None unless "preimport" enabled them.
+
+        #### Notes
+        A cache is loaded again if its file has changed, and dropped once its
+        file is gone. A cache that cannot be loaded is left to the child, which
+        then reports the error.
+        """
+        if self.setup_caches is None:
+            return None
+        for path in list(self.setup_caches):
+            if not os.path.exists(path):
+                del self.setup_caches[path]
+                del self.setup_cache_stamps[path]
+
+        loaded = False
+        for command in commands:
+            try:
+                name, _ = _parse_benchmark_id(command["benchmark_id"])
+            except ValueError:
+                continue
+            benchmark = self.benchmarks.get(name)
+            if benchmark is None or benchmark.setup_cache_key is None:
+                continue
+            # The child keys its caches by path relative to os.getcwd()
+            path = os.path.join(os.path.realpath(command["cwd"]), "cache.pickle")
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp = (st.st_mtime_ns, st.st_size)
+            if self.setup_cache_stamps.get(path) == stamp:
+                continue
+            self.setup_caches.pop(path, None)
+            self.setup_cache_stamps.pop(path, None)
+            try:
+                with open(path, "rb") as fd:
+                    self.setup_caches[path] = pickle.load(fd)
+            except Exception:
+                continue
+            self.setup_cache_stamps[path] = stamp
+            loaded = True
+
+        if loaded and self.frozen:
+            gc.freeze()
+        return self.setup_caches
+
+    def _drain(self, job):
+        """Reads the available output of a job, and answers the benchmarks of
+        the child that have finished."""
+        if not job.output.read_from(job.output_fd):
+            self.selector.unregister(job.output_fd)
+            job.close_output()
+        if isinstance(job.output, _FramedOutput):
+            # The last one is answered once the child has exited, with the
+            # resource usage of the whole child
+            results = job.output.results
+            while job.replied < min(len(results), len(job.indices) - 1):
+                out, errcode = results[job.replied]
+                results[job.replied] = None
+                index = job.indices[job.replied]
+                info = {"out": out, "errcode": errcode, "index": index}
+                job.client.reply(job.request_id, info)
+                job.replied += 1
+
+    def _reap(self, job):
+        """Reports a job if its child has exited."""
+        res, status, rusage = os.wait4(job.pid, os.WNOHANG)
+        if res == 0:
+            return
+        if job.pidfd is not None:
+            self.selector.unregister(job.pidfd)
+        if job.output_fd is not None:
+            # Whatever the child wrote is in the pipe by now; do not wait for
+            # the end of file, which grandchildren may hold back.
+            self._drain(job)
+            if job.output_fd is not None:
+                self.selector.unregister(job.output_fd)
+        job.close()
+        del self.jobs[job.pid]
+        self.free_slots.append(job.slot)
+
+        # Emulate subprocess
+        retcode = -256 if job.is_timeout else _exit_status_to_retcode(status)
+        usage = _rusage_to_dict(rusage)
+        memory = None
+        if self.memory_reports is not None:
+            memory = _read_memory_report(self.memory_reports[job.slot])
+        partial = None
+        if job.is_timeout:
+            partial = self.sample_rings[job.slot].get_result()
+        if isinstance(job.output, _FramedOutput):
+            results = job.output.results
+            unfinished = job.output.current.getvalue()
+        else:
+            results = []
+            unfinished = job.output.getvalue()
+
+        for k in range(job.replied, len(job.indices)):
+            index = job.indices[k]
+            if k < len(results):
+                out, errcode = results[k]
+            else:
+                # Benchmarks the child did not finish share its fate
+                out = unfinished if k == len(results) else ""
+                errcode = retcode
+            info = {"out": out, "errcode": errcode, "rusage": usage}
+            if memory is not None:
+                info["memory"] = memory
+            if partial is not None and k == len(results):
+                info["partial"] = partial
+            if index is not None:
+                info["index"] = index
+            job.client.reply(job.request_id, info)
+
+    def _reap_all(self):
+        """Reports every job whose child has exited (`SIGCHLD` fallback)."""
+        self.exit_pipe.drain()
+        for job in list(self.jobs.values()):
+            if job.pidfd is None:
+                self._reap(job)
+
+    def _update_client(self, client):
+        """
+        Closes a client connection once it has nothing left to receive, or
+        else registers it for the events it waits for: new commands on a
+        session, and the socket accepting its pending output.
+        """
+        if client.done():
+            if client.events:
+                self.selector.unregister(client)
+            self.clients.discard(client)
+            client.close()
+            return
+        events = 0
+        if not client.eof:
+            events |= selectors.EVENT_READ
+        if client.output:
+            events |= selectors.EVENT_WRITE
+        if events == client.events:
+            return
+        if not client.events:
+            self.selector.register(
+                client, events, lambda mask: self._client_ready(client, mask)
+            )
+        elif not events:
+            self.selector.unregister(client)
+        else:
+            self.selector.modify(
+                client, events, lambda mask: self._client_ready(client, mask)
+            )
+        client.events = events
+
+    def close(self):
+        """Kills the children still in flight and releases the server
+        resources."""
+        # Do not leave orphaned benchmark children behind
+        for pid, job in self.jobs.items():
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (KeyboardInterrupt, OSError):
+                pass
+            job.close()
+        self.jobs = {}
+        for client in self.clients:
+            client.close()
+        self.clients = set()
+        self.selector.close()
+        for memory_report in self.memory_reports or ():
+            memory_report.close()
+        for sample_ring in self.sample_rings:
+            sample_ring.close()
+        if self.exit_pipe is not None:
+            self.exit_pipe.close()
 
 
 def _run_server(args):
@@ -58,15 +1478,14 @@ def _run_server(args):
 
     #### Parameters
     **args** (`tuple`)
-    : A tuple containing the benchmark directory and socket name.
+    : A tuple containing the benchmark directory, socket name and, optionally,
+    the number of workers.
 
     - `benchmark_dir` (`str`): The directory where the benchmarks are located.
     - `socket_name` (`str`): The name of the UNIX socket to be used for
     - communication.
-
-    #### Raises
-    **RuntimeError**
-    : If the received command contains unknown data.
+    - `workers` (`str` or `int`, optional): The maximum number of benchmark
+      children running at the same time. Defaults to 1.
 
     #### Notes
     This function creates a server that listens on a UNIX socket for commands.
@@ -79,10 +1498,91 @@ def _run_server(args):
     benchmarks are imported, the function sends the contents of the output file
     back through the socket.
 
+    A "preimport" command with `"freeze": true` then runs a full garbage
+    collection and calls `gc.freeze()`, so that the imported objects are
+    ignored by the cyclic garbage collector of the children and their memory
+    pages stay shared with the server instead of being copied in every child.
+
+    The benchmarks found by "preimport" are kept in an index by name, so that
+    a child only selects the parameters of an already built `Benchmark`
+    instead of looking it up, fetching its source code and hashing it again.
+    With `"setup_caches": true`, the server also unpickles the `cache.pickle`
+    of a benchmark before forking its child, and keeps it until the file
+    changes or is removed, so children share it instead of loading it again.
+
     If the action is not "quit" or "preimport", the function assumes it is a
-    command to run a specific benchmark. It then runs the benchmark and waits
-    for the results. It also handles a timeout for the benchmark execution and
-    sends the results back through the socket.
+    command to run a specific benchmark. It forks a child that runs the
+    benchmark, and reports the result through the socket once the child has
+    exited. It also handles a timeout for the benchmark execution.
+
+    Every reply to a benchmark command also carries the resource usage of its
+    child, as reported by `os.wait4`, under `rusage`: CPU times (`utime`,
+    `stime`), the peak resident set size in bytes (`maxrss`), page faults
+    (`minflt`, `majflt`) and context switches (`nvcsw`, `nivcsw`). Items of a
+    "run_many" command that share a child and are answered when it exits
+    report the usage of the whole child; those answered before carry none.
+    Where `/proc/<pid>/smaps_rollup` is available, the child's memory that is
+    not shared with the server (`private_clean`, `private_dirty`) and its
+    proportional set size (`pss`), in bytes and measured right before it
+    exits, are reported under `memory`.
+
+    When a benchmark times out, the timing samples its child had collected are
+    not lost: they are reported under `partial`, as `{"samples": [...],
+    "number": ...}` like the result of a timing benchmark, next to the
+    -256 error code.
+
+    A child that times out writes the stacks of all its threads to its output
+    with `faulthandler` before it is killed, unless the command sets
+    `"stack_dump": false`. A command can also set `stack_sample_time` to have
+    the stacks dumped every `_STACK_SAMPLE_INTERVAL` seconds during that many
+    final seconds before its timeout, a coarse statistical profile of where a
+    slow benchmark spends its time.
+
+    The output of every child is read from a pipe into a buffer that keeps the
+    last `output_limit` bytes of each benchmark (an optional key of `run`
+    commands, `DEFAULT_OUTPUT_LIMIT` by default); if more was written, the
+    reported output starts with a truncation marker.
+
+    The "run_many" command carries a list of `run` commands under `items` and
+    an optional `isolation` level. With "item" (the default) every benchmark
+    gets its own child, as with separate `run` commands. With "benchmark" all
+    parameter combinations of a benchmark sharing a working directory run one
+    after another in a single child, which imports the suite and unpickles the
+    setup cache once; its timeout is the sum of the item timeouts. One reply is
+    sent per item, tagged with the position of the item in the list as
+    `index`: as soon as the item has finished, except for the last item of a
+    child and those it did not finish, which are answered once it has exited.
+
+    With more than one worker, the server keeps up to `workers` children in
+    flight. Each worker slot is pinned to a disjoint subset of the CPUs
+    available to the server, and further connections are accepted while
+    children run, so independent clients get their results as soon as their
+    own child finishes. With a single worker (the default) commands are handled
+    strictly one after another, as before. A "quit" command stops accepting
+    connections and returns once the children in flight have been reported.
+
+    A connection whose first command is "session" stays open: the server
+    answers `{"protocol": SESSION_PROTOCOL}` and then reads any number of
+    further commands from it. Each command carries a client chosen
+    `request_id`, which is copied into its reply, so a client can pipeline
+    many `run` commands over one connection and match the results, which
+    arrive in the order the children finish. On a session, the reply to
+    "preimport" is `{"request_id": ..., "out": ...}`. The session ends when the
+    client closes its end; results still in flight are sent before the server
+    closes the connection.
+
+    A malformed command (unknown action or data, missing keys) is answered
+    with `{"error": ...}`, tagged with its `request_id` on a session, and the
+    server stops reading from that connection; it closes it once the commands
+    already in flight have been answered, and keeps serving other clients.
+
+    The server blocks in a single `selectors` call until a connection arrives,
+    a child exits, a client can take more of its pending replies or the
+    earliest pending timeout expires. Replies are never written with a
+    blocking call, so a client that does not read them delays no one else.
+    Child exits are observed through process file descriptors where available
+    and through a `SIGCHLD` self-pipe otherwise, so the server does not wake
+    up while a benchmark is being measured.
 
     The function continuously accepts new commands until it receives a "quit"
     command or a KeyboardInterrupt.
@@ -94,150 +1594,23 @@ def _run_server(args):
     accordingly. After executing the command, the server sends back the result
     through the socket and waits for the next command.
     """
-    import signal
-    import socket
 
-    (
-        benchmark_dir,
-        socket_name,
-    ) = args
+    benchmark_dir, socket_name = args[:2]
+    workers = int(args[2]) if len(args) > 2 else 1
+    if workers < 1:
+        raise ValueError(f"Number of server workers must be positive, got {workers}")
 
     update_sys_path(benchmark_dir)
 
     # Socket I/O
     s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     s.bind(socket_name)
-    s.listen(1)
-
-    # Read and act on commands from socket
-    while True:
-        stdout_file = None
-
-        try:
-            conn, addr = s.accept()
-        except KeyboardInterrupt:
-            break
-
-        try:
-            fd, stdout_file = tempfile.mkstemp()
-            os.close(fd)
-
-            # Read command
-            (read_size,) = struct.unpack("<Q", recvall(conn, 8))
-            command_text = recvall(conn, read_size)
-            command_text = command_text.decode("utf-8")
-
-            # Parse command
-            command = json.loads(command_text)
-            action = command.pop("action")
+    s.listen(workers)
 
-            if action == "quit":
-                break
-            elif action == "preimport":
-                # Import benchmark suite before forking.
-                # Capture I/O to a file during import.
-                with posix_redirect_output(stdout_file, permanent=False):
-                    for _ in disc_benchmarks(benchmark_dir, ignore_import_errors=True):
-                        pass
-
-                # Report result
-                with open(stdout_file, errors="replace") as f:
-                    out = f.read()
-                out = json.dumps(out)
-                out = out.encode("utf-8")
-                conn.sendall(struct.pack("<Q", len(out)))
-                conn.sendall(out)
-                continue
-
-            benchmark_id = command.pop("benchmark_id")
-            params_str = command.pop("params_str")
-            profile_path = command.pop("profile_path")
-            result_file = command.pop("result_file")
-            timeout = command.pop("timeout")
-            cwd = command.pop("cwd")
-
-            if command:
-                raise RuntimeError(f"Command contained unknown data: {command_text!r}")
-
-            # Spawn benchmark
-            run_args = (
-                benchmark_dir,
-                benchmark_id,
-                params_str,
-                profile_path,
-                result_file,
-            )
-            pid = os.fork()
-            if pid == 0:
-                conn.close()
-                sys.stdin.close()
-                exitcode = 1
-                try:
-                    with posix_redirect_output(stdout_file, permanent=True):
-                        try:
-                            os.chdir(cwd)
-                            _run(run_args)
-                            exitcode = 0
-                        except BaseException:
-                            import traceback
-
-                            traceback.print_exc()
-                finally:
-                    os._exit(exitcode)
-
-            # Wait for results
-            # (Poll in a loop is simplest --- also used by subprocess.py)
-            start_time = wall_timer()
-            is_timeout = False
-            time2sleep = 1e-15
-            while True:
-                res, status = os.waitpid(pid, os.WNOHANG)
-                if res != 0:
-                    break
-
-                if timeout is not None and wall_timer() > start_time + timeout:
-                    # Timeout
-                    if is_timeout:
-                        os.kill(pid, signal.SIGKILL)
-                    else:
-                        os.kill(pid, signal.SIGTERM)
-                    is_timeout = True
-                time2sleep *= 1e1
-                time.sleep(min(time2sleep, 0.001))
-
-            # Report result
-            with open(stdout_file, errors="replace") as f:
-                out = f.read()
-
-            # Emulate subprocess
-            if os.WIFSIGNALED(status):
-                retcode = -os.WTERMSIG(status)
-            elif os.WIFEXITED(status):
-                retcode = os.WEXITSTATUS(status)
-            elif os.WIFSTOPPED(status):
-                retcode = -os.WSTOPSIG(status)
-            else:
-                # shouldn't happen, but fail silently
-                retcode = -128
-
-            info = {"out": out, "errcode": -256 if is_timeout else retcode}
-
-            result_text = json.dumps(info)
-            result_text = result_text.encode("utf-8")
-
-            conn.sendall(struct.pack("<Q", len(result_text)))
-            conn.sendall(result_text)
-        except KeyboardInterrupt:
-            break
-        finally:
-            # Parent may deliver SIGINT during teardown (asv#1511); do not let
-            # cleanup raise KeyboardInterrupt and spam the benchmark log.
-            try:
-                conn.close()
-            except KeyboardInterrupt:
-                pass
-            if stdout_file is not None:
-                try:
-                    os.unlink(stdout_file)
-                except (KeyboardInterrupt, OSError):
-                    pass
+    server = _Server(benchmark_dir, s, workers)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -17,7 +17,8 @@ def _setup_cache(args):
     - `benchmark_dir` (`str`): The directory where the benchmarks are located.
     - `benchmark_id` (`str`): The ID of the specific benchmark to be set up.
     - `params_str` (`str`): A JSON string containing extra parameters for the
-      benchmark.
+      benchmark. Its `index_file`, if any, is the benchmark index written by
+      discovery.
 
     #### Notes
     This function sets up a cache for a specific benchmark and saves it into a
@@ -37,7 +38,9 @@ def _setup_cache(args):
 
     set_cpu_affinity_from_params(extra_params)
 
-    benchmark = get_benchmark_from_name(benchmark_dir, benchmark_id)
+    benchmark = get_benchmark_from_name(
+        benchmark_dir, benchmark_id, index_file=extra_params.get("index_file")
+    )
     cache = benchmark.do_setup_cache()
     with open("cache.pickle", "wb") as fd:
         pickle.dump(cache, fd)
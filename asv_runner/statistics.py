@@ -1,3 +1,4 @@
+import functools
 import math
 
 
@@ -127,16 +128,56 @@ def quantile_ci(x, q, alpha_min=0.01):
     smallest range (y[r-1], y[s-1]) for which the coverage is at least
     alpha_min.
     """
+    return sorted_quantile_ci(sorted(x), q, alpha_min)
 
-    y = sorted(x)
-    n = len(y)
 
+def sorted_quantile_ci(y, q, alpha_min=0.01):
+    """
+    Compute a quantile and a confidence interval for a sorted dataset, as
+    `quantile_ci`.
+
+    #### Parameters
+    **y** (`list` of `float`)
+    : The dataset, sorted in increasing order.
+
+    **q** (`float`)
+    : The quantile to compute. Must be in the range [0, 1].
+
+    **alpha_min** (`float`, optional)
+    : Limit for coverage. The result has coverage >= 1 - alpha_min. Defaults to 0.01.
+
+    #### Returns
+    **m** (`float`)
+    : The computed quantile from the dataset.
+
+    **ci** (`tuple` of `float`)
+    : Confidence interval (a, b), of coverage >= alpha_min.
+
+    #### Notes
+    The ranks of the bounds of the interval only depend on the size of the
+    dataset, and are computed once per size; see `_quantile_ci_ranks`. A
+    dataset kept sorted as it grows thus gets its interval in constant time
+    besides the quantile.
+    """
     alpha_min = min(alpha_min, 1 - alpha_min)
+    ra, rb = _quantile_ci_ranks(len(y), q, alpha_min)
+    a = -math.inf if ra is None else y[ra]
+    b = math.inf if rb is None else y[rb]
+    m = quantile(y, q)
+    return m, (a, b)
+
+
+@functools.lru_cache(maxsize=1024)
+def _quantile_ci_ranks(n, q, alpha_min):
+    """
+    Returns the indices in a sorted dataset of size `n` of the bounds of the
+    confidence interval of its quantile `q`, each None for an infinite bound.
+    """
     pa = alpha_min / 2
     pb = 1 - pa
 
-    a = -math.inf
-    b = math.inf
+    ra = None
+    rb = None
 
     # It's known that
     #
@@ -155,19 +196,18 @@ def quantile_ci(x, q, alpha_min=0.01):
     # If no such r or s exists, replace by +-inf.
 
     F = 0
-    for k, yp in enumerate(y):
+    for k in range(n):
         F += binom_pmf(n, k, q)
         # F = F(k+1;n,q)
 
         if F <= pa:
-            a = yp
+            ra = k
 
         if F >= pb:
-            b = yp
+            rb = k
             break
 
-    m = quantile(y, q)
-    return m, (a, b)
+    return ra, rb
 
 
 class LaplacePosterior:
@@ -12,7 +12,11 @@ if _ROOT not in sys.path:
     sys.path.insert(0, _ROOT)
 
 from asv_runner.benchmarks._base import Benchmark  # noqa: E402
-from asv_runner.benchmarks.mark import benchmark, skip_for_params  # noqa: E402
+from asv_runner.benchmarks.mark import (  # noqa: E402
+    benchmark,
+    skip_for_params,
+    skip_params_where,
+)
 from asv_runner.benchmarks.track import TrackBenchmark  # noqa: E402
 
 
@@ -122,5 +126,121 @@ class TestCacheSkipAndSetup(unittest.TestCase):
         self.assertIn("Unknown benchmark attribute", str(ctx.exception))
 
 
+class TestParamIndex(unittest.TestCase):
+    def test_index_round_trip_matches_product(self):
+        import itertools
+
+        def track_fn(n, dtype, flag):
+            return n
+
+        track_fn.params = [[1, 2, 3], ["f4", "f8"], [True, False]]
+        b = _make_track_benchmark(track_fn, "mod.track_grid")
+        product = list(itertools.product(*track_fn.params))
+        for param_idx, param_tuple in enumerate(product):
+            self.assertEqual(b.get_param_tuple(param_idx), param_tuple)
+            self.assertEqual(b.get_param_idx(param_tuple), param_idx)
+        b.set_param_idx(len(product) - 1)
+        self.assertEqual(b._current_params, (3, "f8", False))
+
+        for param_idx in (-1, len(product), 1.0, None):
+            with self.assertRaises(ValueError):
+                b.set_param_idx(param_idx)
+        for param_tuple in ((4, "f4", True), (1, "f4")):
+            with self.assertRaises(ValueError):
+                b.get_param_idx(param_tuple)
+
+    def test_large_grid_late_index(self):
+        def track_fn(*args):
+            return 0
+
+        track_fn.params = [list(range(20))] * 6
+        b = _make_track_benchmark(track_fn, "mod.track_large")
+        b.set_param_idx(20**6 - 1)
+        self.assertEqual(b._current_params, (19,) * 6)
+        self.assertEqual(b.get_param_idx((19,) * 6), 20**6 - 1)
+
+
+class TestSkipRules(unittest.TestCase):
+    def test_tuples_and_predicates(self):
+        calls = []
+
+        def small(n, kind):
+            calls.append((n, kind))
+            return n < 10
+
+        @skip_params_where(lambda n, kind: kind == "b" and n == 100)
+        @skip_params_where(small)
+        @skip_for_params([(1000, "a")])
+        def track_fn(n, kind):
+            return n
+
+        track_fn.params = [[1, 100, 1000], ["a", "b"]]
+        b = _make_track_benchmark(track_fn, "mod.track_rules")
+        self.assertEqual(b.skipped_param_idx, [0, 1, 3, 4])
+        from asv_runner.discovery import _benchmark_listing
+
+        self.assertEqual(_benchmark_listing(b)["skipped_param_idx"], [0, 1, 3, 4])
+
+        b.set_param_idx(3)
+        del calls[:]
+        self.assertTrue(b.do_setup())
+        self.assertIsNone(b.do_run())
+        b.do_teardown()
+        # Evaluated once per parameter set
+        self.assertEqual(calls, [(100, "b")])
+        b.set_param_idx(2)
+        self.assertFalse(b.do_setup())
+        self.assertEqual(b.do_run(), 100)
+
+    def test_no_rules_not_listed(self):
+        def track_fn(n):
+            return n
+
+        track_fn.params = [1, 2]
+        b = _make_track_benchmark(track_fn, "mod.track_plain")
+        self.assertIsNone(b.skipped_param_idx)
+        from asv_runner.discovery import _benchmark_listing
+
+        self.assertNotIn("skipped_param_idx", _benchmark_listing(b))
+
+    def test_large_grid_skip_tuples(self):
+        @skip_for_params([(19,) * 6, (0, 1), (0,) * 5 + (20,), (1,) * 6])
+        def track_fn(*args):
+            return 0
+
+        track_fn.params = [list(range(20))] * 6
+        b = _make_track_benchmark(track_fn, "mod.track_large")
+        # Invalid combinations skip nothing
+        self.assertEqual(b.skipped_param_idx, [b.get_param_idx((1,) * 6), 20**6 - 1])
+
+        # Predicates are only evaluated on grids of a bounded size
+        track_fn.skip_predicates = [lambda *args: False]
+        b = _make_track_benchmark(track_fn, "mod.track_large")
+        self.assertIsNone(b.skipped_param_idx)
+        self.assertTrue(b._skips((19,) * 6))
+
+    def test_repeated_values_all_skipped(self):
+        @skip_for_params([(1, "a")])
+        def track_fn(n, kind):
+            return n
+
+        track_fn.params = [[1, 2, 1], ["a", "b"]]
+        b = _make_track_benchmark(track_fn, "mod.track_repeated")
+        self.assertEqual(b.skipped_param_idx, [0, 4])
+
+    def test_unhashable_params(self):
+        @skip_for_params([([1, 2], "x")])
+        def track_fn(values, kind):
+            return len(values)
+
+        track_fn.params = [[[1, 2], [3]], ["x", "y"]]
+        b = _make_track_benchmark(track_fn, "mod.track_lists")
+        self.assertEqual(b.skipped_param_idx, [0])
+        b.set_param_idx(0)
+        self.assertTrue(b.do_setup())
+        b.set_param_idx(1)
+        self.assertFalse(b.do_setup())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,589 @@
+# Benchmark discovery (asv_runner.discovery), run in subprocesses so that each
+# discovery starts from a fresh interpreter as with asv.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from asv_runner.discovery import read_ndjson_listing  # noqa: E402
+
+# Every module records its import in the file named by IMPORT_LOG
+MODULE_TEMPLATE = textwrap.dedent(
+    """
+    import os
+
+    with open(os.environ["IMPORT_LOG"], "a") as f:
+        f.write(__name__ + "\\n")
+
+    def time_{name}():
+        pass
+
+    def track_{name}(n):
+        return n
+
+    track_{name}.params = [1, 2]
+    """
+)
+
+
+class DiscoveryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.benchmark_dir = os.path.join(self.tmpdir, "benchmarks")
+        os.makedirs(os.path.join(self.benchmark_dir, "sub"))
+        self.write_module("__init__.py", "")
+        self.write_module("sub/__init__.py", "")
+        self.write_module("a.py", MODULE_TEMPLATE.format(name="a"))
+        self.write_module("sub/b.py", MODULE_TEMPLATE.format(name="b"))
+        self.import_log = os.path.join(self.tmpdir, "imports.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_module(self, name, source):
+        with open(os.path.join(self.benchmark_dir, name), "w") as f:
+            f.write(source)
+
+    def discover(self, *extra_args):
+        """Runs `_discover` and returns the listing and the imported modules."""
+        if os.path.exists(self.import_log):
+            os.unlink(self.import_log)
+        result_file = os.path.join(self.tmpdir, "result.json")
+        subprocess.check_call(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from asv_runner.discovery import _discover; "
+                "_discover(sys.argv[1:])",
+                self.benchmark_dir,
+                result_file,
+                *extra_args,
+            ],
+            env=dict(os.environ, PYTHONPATH=_ROOT, IMPORT_LOG=self.import_log),
+        )
+        with open(result_file) as f:
+            if "--ndjson" in extra_args:
+                listing = list(read_ndjson_listing(f))
+            else:
+                listing = json.load(f)
+        imported = []
+        if os.path.exists(self.import_log):
+            with open(self.import_log) as f:
+                imported = f.read().split()
+        return listing, imported
+
+
+class TestDiscoveryCache(DiscoveryTestCase):
+    def test_cache(self):
+        cache_file = os.path.join(self.tmpdir, "discovery.json")
+        cache_option = f"--cache-file={cache_file}"
+        listing, imported = self.discover()
+        self.assertEqual(
+            [b["name"] for b in listing],
+            ["a.time_a", "a.track_a", "sub.b.time_b", "sub.b.track_b"],
+        )
+
+        # First run fills the cache, the second one imports nothing
+        self.assertEqual(self.discover(cache_option), (listing, imported))
+        self.assertEqual(self.discover(cache_option), (listing, []))
+
+        # Touching a file does not invalidate its listing
+        os.utime(os.path.join(self.benchmark_dir, "a.py"), (0, 0))
+        self.assertEqual(self.discover(cache_option), (listing, []))
+
+        # Only the changed module is imported again
+        self.write_module("sub/b.py", MODULE_TEMPLATE.format(name="c"))
+        listing, imported = self.discover(cache_option)
+        self.assertEqual(imported, ["benchmarks.sub.b"])
+        self.assertEqual(
+            [b["name"] for b in listing],
+            ["a.time_a", "a.track_a", "sub.b.time_c", "sub.b.track_c"],
+        )
+        all_modules = ["benchmarks.a", "benchmarks.sub.b"]
+        self.assertEqual(self.discover(), (listing, all_modules))
+
+        # Removed modules are dropped
+        os.unlink(os.path.join(self.benchmark_dir, "a.py"))
+        listing, imported = self.discover(cache_option)
+        names = [b["name"] for b in listing]
+        self.assertEqual(names, ["sub.b.time_c", "sub.b.track_c"])
+        self.assertEqual(imported, [])
+
+    def test_cache_other_environment(self):
+        cache_file = os.path.join(self.tmpdir, "discovery.json")
+        cache_option = f"--cache-file={cache_file}"
+        self.discover(cache_option)
+        with open(cache_file) as f:
+            data = json.load(f)
+        data["environment"] = "other"
+        with open(cache_file, "w") as f:
+            json.dump(data, f)
+        _, imported = self.discover(cache_option)
+        self.assertEqual(imported, ["benchmarks.a", "benchmarks.sub.b"])
+
+
+# Records its import, but is resolved statically by itself
+LOGGED_SOURCE = textwrap.dedent(
+    """
+    import functools
+    import os
+
+    with open(os.environ["IMPORT_LOG"], "a") as f:
+        f.write(__name__ + "\\n")
+    """
+)
+
+# Resolved without importing: mark decorators, literal attributes, constants
+STATIC_SOURCE = LOGGED_SOURCE + textwrap.dedent(
+    """
+    from asv_runner.benchmarks import mark
+    from asv_runner.benchmarks.mark import parameterize
+
+    SIZES = [10, 100]
+
+    def helper(x=os.sep):
+        return x
+
+    @parameterize({"n": SIZES, "kind": ["a", "b"]})
+    def time_param(n, kind):
+        helper()
+
+    @mark.skip_for_params([(10, "a")])
+    @mark.parameterize({"n": SIZES, "kind": ["a", "b"]})
+    def track_skipped(n, kind) -> int:
+        return n
+
+    track_skipped.unit = "things"
+
+    @mark.benchmark(pretty_name="renamed", timeout=12)
+    def track_list(size: int = len(SIZES)):
+        return size
+
+    @functools.lru_cache()
+    def cached_helper():
+        pass
+
+    class Base:
+        timeout = 30
+        def setup(self, *args):
+            self.data = list(range(10))
+
+    class TimeSuite(Base):
+        \"\"\"Docstring.\"\"\"
+        params = SIZES
+        param_names = ["size"]
+        version = "1"
+        rounds = 3
+        def setup_cache(self):
+            return 1
+        def time_sum(self, cache, size):
+            sum(self.data)
+        @mark.timeout_at(5)
+        def peakmem_list(self, cache, size):
+            [0] * size
+
+    def track_retyped():
+        return 1
+
+    track_retyped.pretty_source = "retyped"
+    """
+)
+
+# Statements after which a module has to be imported
+FALLBACK_SOURCES = [
+    # May be a class defining benchmarks
+    "from .a import time_a as TimeA",
+    "from asv_runner.benchmarks.mark import *",
+    "def track_x(n):\n    return n\ntrack_x.params = list(range(3))",
+    "def time_x():\n    pass\nfor f in [time_x]:\n    f.number = 1",
+    "def time_x():\n    pass\nsetattr(time_x, 'number', 1)",
+    "params = [os.sep]",
+    "@functools.lru_cache()\ndef time_x():\n    pass",
+    "class TimeX(object, metaclass=type):\n    pass",
+    "class TimeX:\n    def __init__(self):\n        pass",
+    # Benchmarks defined by a loop in the class body
+    textwrap.dedent(
+        """
+        class TimeGen:
+            def time_a(self):
+                pass
+            for _n in range(3):
+                locals()[f"time_gen{_n}"] = time_a
+        """
+    ),
+    # Attributes set by a base class hook
+    textwrap.dedent(
+        """
+        class Base:
+            def __init_subclass__(cls, **kwargs):
+                cls.params = [1, 2, 3]
+
+        class TrackSub(Base):
+            def track_x(self, n):
+                return n
+        """
+    ),
+]
+
+
+class TestStaticDiscovery(DiscoveryTestCase):
+    def test_static(self):
+        self.write_module("c.py", STATIC_SOURCE)
+        self.write_module("d.py", LOGGED_SOURCE + FALLBACK_SOURCES[2])
+        listing, imported = self.discover()
+        self.assertEqual(
+            imported,
+            ["benchmarks.a", "benchmarks.c", "benchmarks.d", "benchmarks.sub.b"],
+        )
+        self.assertEqual(
+            [b["name"] for b in listing if b["name"].startswith("c.")],
+            [
+                "c.time_param",
+                "c.track_skipped",
+                "c.track_list",
+                "c.TimeSuite.peakmem_list",
+                "c.TimeSuite.time_sum",
+                "c.track_retyped",
+            ],
+        )
+
+        static_listing, imported = self.discover("--static")
+        self.assertEqual(static_listing, listing)
+        self.assertEqual(imported, ["benchmarks.d"])
+
+    def test_static_fallback(self):
+        for i, source in enumerate(FALLBACK_SOURCES):
+            self.write_module(f"e{i:02d}.py", LOGGED_SOURCE + source + "\n")
+        listing, imported = self.discover("--static")
+        expected = [f"benchmarks.e{i:02d}" for i in range(len(FALLBACK_SOURCES))]
+        # The first fallback imports `a` in turn
+        self.assertEqual(imported, expected[:1] + ["benchmarks.a"] + expected[1:])
+        self.assertEqual(self.discover()[0], listing)
+
+
+class TestParallelDiscovery(DiscoveryTestCase):
+    def test_jobs(self):
+        for name in "cdefg":
+            self.write_module(f"sub/{name}.py", MODULE_TEMPLATE.format(name=name))
+        listing, imported = self.discover()
+        parallel_listing, parallel_imported = self.discover("--jobs=3")
+        self.assertEqual(parallel_listing, listing)
+        self.assertEqual(sorted(parallel_imported), sorted(imported))
+
+        # Only the modules that are not cached are imported
+        cache_option = "--cache-file=" + os.path.join(self.tmpdir, "discovery.json")
+        self.discover(cache_option)
+        self.write_module("sub/c.py", MODULE_TEMPLATE.format(name="x"))
+        listing, imported = self.discover(cache_option, "--jobs=3")
+        self.assertEqual(imported, ["benchmarks.sub.c"])
+        self.assertEqual(self.discover()[0], listing)
+
+
+class TestBenchmarkIndex(DiscoveryTestCase):
+    def get_benchmark(self, name, index_file=None):
+        """Runs `get_benchmark_from_name`, returning the benchmark name and the
+        imported modules."""
+        os.unlink(self.import_log)
+        out = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from asv_runner.discovery import get_benchmark_from_name; "
+                "print(get_benchmark_from_name(*sys.argv[1:3], index_file="
+                "(sys.argv[3:] or [None])[0]).name)",
+                self.benchmark_dir,
+                name,
+                *([index_file] if index_file else []),
+            ],
+            env=dict(os.environ, PYTHONPATH=_ROOT, IMPORT_LOG=self.import_log),
+        )
+        with open(self.import_log) as f:
+            return out.decode().strip(), f.read().split()
+
+    def test_index(self):
+        self.write_module(
+            "sub/c.py",
+            MODULE_TEMPLATE.format(name="c")
+            + "time_c.benchmark_name = 'renamed.time_c'\n",
+        )
+        index_file = os.path.join(self.tmpdir, "index.json")
+        self.discover(f"--index-file={index_file}")
+        with open(index_file) as f:
+            index = json.load(f)["benchmarks"]
+        self.assertEqual(index["renamed.time_c"], ["benchmarks.sub.c", None, "time_c"])
+        self.assertEqual(index["sub.b.track_b"], ["benchmarks.sub.b", None, "track_b"])
+
+        # Without the index, the whole suite is imported
+        all_modules = ["benchmarks.a", "benchmarks.sub.b", "benchmarks.sub.c"]
+        self.assertEqual(
+            self.get_benchmark("renamed.time_c"), ("renamed.time_c", all_modules)
+        )
+        self.assertEqual(
+            self.get_benchmark("renamed.time_c", index_file),
+            ("renamed.time_c", ["benchmarks.sub.c"]),
+        )
+
+        # Stale entries fall back to the other lookups
+        self.write_module("sub/c.py", MODULE_TEMPLATE.format(name="c"))
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.get_benchmark("renamed.time_c", index_file)
+        self.assertEqual(
+            self.get_benchmark("sub.c.time_c", index_file),
+            ("sub.c.time_c", ["benchmarks.sub.c"]),
+        )
+
+
+class TestDiscoveryReport(DiscoveryTestCase):
+    def report(self, *extra_args):
+        report_file = os.path.join(self.tmpdir, "report.json")
+        self.discover(f"--report-file={report_file}", *extra_args)
+        with open(report_file) as f:
+            return json.load(f)
+
+    def test_report(self):
+        slow_source = "import time\ntime.sleep(0.2)\n"
+        self.write_module("slow.py", slow_source + MODULE_TEMPLATE.format(name="s"))
+        modules = [
+            "benchmarks",
+            "benchmarks.a",
+            "benchmarks.slow",
+            "benchmarks.sub",
+            "benchmarks.sub.b",
+        ]
+        for extra_args in [(), ("--jobs=2",)]:
+            report = self.report(*extra_args)
+            self.assertEqual(list(report["modules"]), modules)
+            self.assertGreaterEqual(report["wall"], 0.2)
+            slow = report["modules"]["benchmarks.slow"]
+            self.assertEqual(slow["source"], "import")
+            self.assertEqual(slow["count"], 2)
+            self.assertGreaterEqual(slow["import"]["wall"], 0.2)
+            self.assertLess(slow["import"]["cpu"], 0.2)
+            self.assertEqual(
+                sorted(slow["benchmarks"]), ["cpu", "rss", "wall"], extra_args
+            )
+
+        cache_option = "--cache-file=" + os.path.join(self.tmpdir, "discovery.json")
+        self.report(cache_option)
+        report = self.report(cache_option, "--static")
+        self.assertEqual(
+            report["modules"]["benchmarks.a"], {"source": "cache", "count": 2}
+        )
+        self.write_module("a.py", MODULE_TEMPLATE.format(name="x"))
+        report = self.report(cache_option, "--static")
+        self.assertEqual(report["modules"]["benchmarks.a"]["source"], "static")
+
+    def test_report_includes_listing(self):
+        # The parameter ids are only computed when the benchmark is listed
+        slow_source = textwrap.dedent(
+            """
+            import time
+
+            class Slow:
+                def __repr__(self):
+                    time.sleep(0.2)
+                    return "Slow()"
+
+            def track_slow(x):
+                return 0
+
+            track_slow.params = [Slow()]
+            """
+        )
+        self.write_module("slow.py", slow_source)
+        index_file = os.path.join(self.tmpdir, "index.json")
+        for extra_args in [(), (f"--index-file={index_file}",)]:
+            report = self.report(*extra_args)
+            slow = report["modules"]["benchmarks.slow"]
+            self.assertGreaterEqual(slow["benchmarks"]["wall"], 0.2, extra_args)
+
+
+# Records the creation of its benchmarks from the class
+CLASS_SOURCE = MODULE_TEMPLATE.format(name="c") + textwrap.dedent(
+    """
+    class Suite:
+        def __init__(self):
+            with open(os.environ["IMPORT_LOG"], "a") as f:
+                f.write("Suite()\\n")
+
+        def time_method(self):
+            pass
+    """
+)
+
+
+class TestDiscoveryFilter(DiscoveryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_module("sub/c.py", CLASS_SOURCE)
+
+    def names(self, *extra_args):
+        listing, imported = self.discover(*extra_args)
+        return [b["name"] for b in listing], imported
+
+    def test_filter(self):
+        all_modules = ["benchmarks.a", "benchmarks.sub.b", "benchmarks.sub.c"]
+        self.assertEqual(
+            self.names("--bench=track", "--bench=^a"),
+            (
+                ["a.time_a", "a.track_a", "sub.b.track_b", "sub.c.track_c"],
+                all_modules,
+            ),
+        )
+        # The class is not instantiated for its time benchmark
+        self.assertEqual(
+            self.names("--kind=track"),
+            (["a.track_a", "sub.b.track_b", "sub.c.track_c"], all_modules),
+        )
+        self.assertEqual(
+            self.names("--kind=time", "--module=sub.c"),
+            (
+                ["sub.c.time_c", "sub.c.Suite.time_method"],
+                ["benchmarks.sub.c", "Suite()"],
+            ),
+        )
+        self.assertEqual(
+            self.names("--module=sub", "--static", "--jobs=2", "--bench=_b$"),
+            (["sub.b.time_b", "sub.b.track_b"], ["benchmarks.sub.c"]),
+        )
+
+    def test_filter_cache(self):
+        cache_option = "--cache-file=" + os.path.join(self.tmpdir, "discovery.json")
+        listing, _ = self.discover(cache_option)
+        self.assertEqual(
+            self.names(cache_option, "--module=sub.b", "--kind=time"),
+            (["sub.b.time_b"], []),
+        )
+
+        # Filtered listings are not cached
+        self.write_module("a.py", MODULE_TEMPLATE.format(name="x"))
+        self.assertEqual(
+            self.names(cache_option, "--kind=time", "--bench=_x$"),
+            (["a.time_x"], ["benchmarks.a"]),
+        )
+        listing, imported = self.discover(cache_option)
+        self.assertEqual(imported, ["benchmarks.a"])
+        self.assertEqual(self.discover()[0], listing)
+
+
+SHARED_SOURCE = textwrap.dedent(
+    """
+    import os
+
+    def log(line):
+        with open(os.environ["IMPORT_LOG"], "a") as f:
+            f.write(line + "\\n")
+
+    class Base:
+        def __init__(self):
+            log(type(self).__name__ + "()")
+
+        def time_inherited(self):
+            pass
+
+    class Shared(Base):
+        @staticmethod
+        def time_static():
+            pass
+
+        @classmethod
+        def time_class(cls):
+            pass
+
+        def time_b(self):
+            pass
+
+        def time_a(self):
+            pass
+
+    class PerBenchmark(Base):
+        shared_instance = False
+
+        def time_a(self):
+            pass
+
+        def time_b(self):
+            pass
+    """
+)
+
+
+class TestSharedInstance(DiscoveryTestCase):
+    def test_shared_instance(self):
+        self.write_module("sub/c.py", SHARED_SOURCE)
+        listing, imported = self.discover("--module=sub.c")
+        names = [b["name"] for b in listing]
+        self.assertEqual(
+            [name for name in names if name.startswith("sub.c.Shared.")],
+            [
+                "sub.c.Shared.time_a",
+                "sub.c.Shared.time_b",
+                "sub.c.Shared.time_class",
+                "sub.c.Shared.time_inherited",
+                "sub.c.Shared.time_static",
+            ],
+        )
+        self.assertEqual(len(names), 9)
+        self.assertEqual(imported.count("Shared()"), 1)
+        self.assertEqual(imported.count("PerBenchmark()"), 3)
+        self.assertEqual(imported.count("Base()"), 1)
+
+
+GRID_SOURCE = textwrap.dedent(
+    """
+    GRID = [list(range(100)), ["float32", "float64"]]
+
+    class Grid:
+        params = GRID
+        param_names = ["n", "dtype"]
+
+        def setup(self, n, dtype):
+            pass
+
+        def time_sum(self, n, dtype):
+            pass
+
+        def time_prod(self, n, dtype):
+            pass
+    """
+)
+
+
+class TestNDJSONListing(DiscoveryTestCase):
+    def records(self, *extra_args):
+        listing, _ = self.discover(*extra_args)
+        with open(os.path.join(self.tmpdir, "result.json")) as f:
+            return listing, [json.loads(line) for line in f]
+
+    def test_ndjson(self):
+        self.write_module("sub/c.py", GRID_SOURCE)
+        listing, _ = self.discover()
+        self.assertEqual(self.records("--ndjson"), (listing, listing))
+
+        deduplicated, records = self.records("--ndjson", "--dedup")
+        self.assertEqual(deduplicated, listing)
+        blobs = [r["$blob"] for r in records if "name" not in r]
+        grid = [r for r in records if r.get("name", "").startswith("sub.c.")]
+        # The shared grid is written once, short params are written inline
+        digest = grid[0]["params"]["$blob"]
+        self.assertEqual([r["params"] for r in grid], [{"$blob": digest}] * 2)
+        self.assertEqual(blobs.count(digest), 1)
+        self.assertEqual(len(set(blobs)), len(blobs))
+        self.assertEqual(records[0]["params"], [])
+        self.assertEqual(records[1]["params"], [["1", "2"]])
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.discover("--dedup")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -54,6 +54,54 @@ class TestTimingScale(unittest.TestCase):
         self.assertLess(median, delay * 2.5, msg=f"samples={samples!r}")
 
 
+class TestCIStopping(unittest.TestCase):
+    def make(self, ci_precision=None, step=1e-3):
+        clock = [0.0]
+
+        def timer():
+            # Every timed run takes exactly `step`
+            clock[0] += step / 2
+            return clock[0]
+
+        def time_x():
+            pass
+
+        time_x.timer = timer
+        time_x.number = 1
+        time_x.warmup_time = 0
+        time_x.rounds = 1
+        if ci_precision is not None:
+            time_x.ci_precision = ci_precision
+        return TimeBenchmark("m.time_x", time_x, [time_x])
+
+    def test_stops_when_precise(self):
+        result = self.make(0.01).run()
+        # The first size with a finite 99% interval of the median
+        self.assertEqual(len(result["samples"]), 8)
+
+    def test_disabled_by_default(self):
+        b = self.make()
+        self.assertEqual(b.ci_precision, 0)
+        self.assertEqual(len(b.run()["samples"]), 10)
+
+    def test_listing_unchanged(self):
+        from asv_runner.discovery import _benchmark_listing
+
+        self.assertNotIn("ci_precision", _benchmark_listing(self.make()))
+        listing = _benchmark_listing(self.make(0.01))
+        self.assertEqual(listing["ci_precision"], 0.01)
+
+    def test_sorted_quantile_ci(self):
+        from asv_runner.statistics import quantile_ci, sorted_quantile_ci
+
+        x = [5.0, 1.0, 3.0, 2.0, 8.0, 4.0, 9.0, 7.0, 6.0, 0.5, 4.5]
+        y = []
+        for n, v in enumerate(x, 1):
+            y.append(v)
+            y.sort()
+            self.assertEqual(sorted_quantile_ci(y, 0.5), quantile_ci(x[:n], 0.5))
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -78,3 +126,168 @@ class TestVersionBackfill(unittest.TestCase):
             self.assertIn(token, b.version_alts)
         else:
             self.assertEqual(b.version_alts, ())
+
+
+class TestLazyAttributes(unittest.TestCase):
+    def test_code_and_version_on_first_access(self):
+        from unittest import mock
+
+        from asv_runner.benchmarks import _base
+        from asv_runner.benchmarks.track import TrackBenchmark
+
+        def track_x(n):
+            return n
+
+        track_x.params = [1, 1]
+        with mock.patch.object(
+            _base, "get_source_code", wraps=_base.get_source_code
+        ) as get_source_code:
+            b = TrackBenchmark("m.track_x", track_x, [track_x])
+            self.assertFalse(get_source_code.called)
+            b.set_param_idx(1)
+            self.assertEqual(b.run(*b._current_params), 1)
+            self.assertFalse(get_source_code.called)
+
+            version = b.version
+            self.assertEqual(get_source_code.call_count, 1)
+            self.assertEqual(b.code, _base.get_source_code([track_x]))
+            self.assertEqual(b.version, version)
+            self.assertEqual(get_source_code.call_count, 2)
+
+        self.assertEqual(b.params, [["1 (0)", "1 (1)"]])
+        b.version = "fixed"
+        self.assertEqual(b.version, "fixed")
+        # Listed in declaration order, as when computed eagerly
+        from asv_runner.discovery import _benchmark_listing
+
+        self.assertEqual(
+            list(_benchmark_listing(b)),
+            ["name", "code", "version", "type", "unit", "param_names", "params"],
+        )
+
+
+class TestSourceMemo(unittest.TestCase):
+    def test_shared_setup_source_extracted_once(self):
+        import inspect
+        from unittest import mock
+
+        from asv_runner.benchmarks import _base
+
+        class Suite:
+            def setup(self):
+                self.data = list(range(10))
+
+            def time_a(self):
+                pass
+
+            def time_b(self):
+                pass
+
+        suite = Suite()
+        with mock.patch.object(
+            inspect, "getsourcelines", wraps=inspect.getsourcelines
+        ) as getsourcelines:
+            codes = [
+                TimeBenchmark("m.Suite." + name, getattr(suite, name), [suite]).code
+                for name in ("time_a", "time_b")
+            ]
+            extracted = [
+                getattr(args[0], "__func__", args[0])
+                for args, _ in getsourcelines.call_args_list
+                if args[0] is not None
+            ]
+
+        self.assertIn("self.data = list(range(10))", codes[0])
+        self.assertEqual(extracted.count(Suite.setup), 1)
+        self.assertEqual(len(extracted), 3)
+        self.assertEqual(codes[1], _base.get_source_code([suite.time_b, suite.setup]))
+
+    def test_memo_does_not_keep_code_alive(self):
+        import gc
+        import importlib.util
+        import tempfile
+
+        from asv_runner.benchmarks import _base
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "discarded.py")
+            with open(path, "w") as f:
+                f.write("def time_x():\n    pass\n")
+            spec = importlib.util.spec_from_file_location("discarded", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+            count = len(_base._source_lines_memo)
+            _base._getsourcelines(module.time_x)
+            self.assertEqual(len(_base._source_lines_memo), count + 1)
+            del module
+            gc.collect()
+            self.assertEqual(len(_base._source_lines_memo), count)
+
+    def test_listing_skips_version_alts(self):
+        from unittest import mock
+
+        from asv_runner.benchmarks import _base
+        from asv_runner.discovery import _benchmark_listing
+
+        def time_x():
+            pass
+
+        b = TimeBenchmark("m.time_x", time_x, [time_x])
+        with mock.patch.object(
+            _base, "code_fingerprint", wraps=_base.code_fingerprint
+        ) as code_fingerprint:
+            listing = _benchmark_listing(b)
+            self.assertFalse(code_fingerprint.called)
+            self.assertNotIn("version_alts", listing)
+            self.assertEqual(len(b.version_alts), 1)
+            self.assertEqual(code_fingerprint.call_count, 1)
+
+
+class TestAttrTable(unittest.TestCase):
+    def test_attributes_looked_up_once(self):
+        from unittest import mock
+
+        from asv_runner.benchmarks import _base
+
+        def time_x():
+            pass
+
+        time_x.number = 3
+        b = TimeBenchmark("m.time_x", time_x, [time_x])
+        with mock.patch.object(
+            _base, "_get_first_attr", wraps=_base._get_first_attr
+        ) as get_first_attr:
+            for _ in range(3):
+                b.do_setup()
+            self.assertFalse(get_first_attr.called)
+        self.assertEqual(b.number, 3)
+
+        # Extra parameters added to the sources are picked up
+        from asv_runner.discovery import _select_benchmark
+
+        _select_benchmark(b, None, {"number": 5})
+        b.do_setup()
+        self.assertEqual(b.number, 5)
+
+    def test_setup_may_set_attributes(self):
+        class Suite:
+            number = 1
+
+            def SetUp(self):
+                self.number += 1
+
+            def time_x(self):
+                pass
+
+        suite = Suite()
+        b = TimeBenchmark("m.Suite.time_x", suite.time_x, [suite.time_x, suite])
+        self.assertEqual(b.number, 1)
+        b.do_setup()
+        self.assertEqual(b.number, 2)
+        b.do_setup()
+        self.assertEqual(b.number, 3)
+
+        Suite.setup = Suite.SetUp
+        with self.assertRaises(ValueError):
+            TimeBenchmark("m.Suite.time_x", suite.time_x, [suite.time_x, Suite])
@@ -0,0 +1,134 @@
+# Running benchmarks (asv_runner.run) in subprocesses, as asv does.
+
+import json
+import math
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+SWEEP_SOURCE = textwrap.dedent(
+    """
+    import os
+    import time
+
+    class Grid:
+        params = [[1, 2, 3], [0.0, 5.0]]
+        param_names = ["n", "sleep"]
+        timeout = 0.5
+
+        def setup_cache(self):
+            return 10
+
+        def setup(self, cache, n, sleep):
+            if n == 3:
+                raise NotImplementedError()
+            with open(os.environ["SETUP_LOG"], "a") as f:
+                f.write(f"{os.getpid()} {n} {sleep}\\n")
+
+        def teardown(self, cache, n, sleep):
+            with open(os.environ["SETUP_LOG"], "a") as f:
+                f.write("teardown\\n")
+
+        def track_grid(self, cache, n, sleep):
+            time.sleep(sleep)
+            if n == 2:
+                raise RuntimeError("n == 2")
+            return cache + n
+    """
+)
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        benchmark_dir = os.path.join(self.tmpdir, "benchmarks")
+        os.makedirs(benchmark_dir)
+        for name, source in (("__init__.py", ""), ("grid.py", SWEEP_SOURCE)):
+            with open(os.path.join(benchmark_dir, name), "w") as f:
+                f.write(source)
+        with open(os.path.join(self.tmpdir, "cache.pickle"), "wb") as f:
+            pickle.dump(10, f)
+        self.setup_log = os.path.join(self.tmpdir, "setup.log")
+        self.result_file = os.path.join(self.tmpdir, "result.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_benchmark(self, benchmark_id, extra_params):
+        return subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys; from asv_runner.run import _run; _run(sys.argv[1:])",
+                os.path.join(self.tmpdir, "benchmarks"),
+                benchmark_id,
+                json.dumps(extra_params),
+                "None",
+                self.result_file,
+            ],
+            cwd=self.tmpdir,
+            env=dict(os.environ, PYTHONPATH=_ROOT, SETUP_LOG=self.setup_log),
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+    def test_sweep(self):
+        proc = self.run_benchmark("grid.Grid.track_grid", {"sweep": True})
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        with open(self.result_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["param_idx"] for r in records], list(range(6)))
+        self.assertEqual(records[0], {"param_idx": 0, "result": 11})
+        self.assertEqual(
+            records[1], {"param_idx": 1, "result": None, "error": "timeout"}
+        )
+        self.assertEqual(records[2]["error"], "failed")
+        self.assertIn("RuntimeError: n == 2", proc.stderr)
+        self.assertTrue(all(math.isnan(r["result"]) for r in records[4:]))
+
+        # Set up and torn down once per combination, in a single process
+        with open(self.setup_log) as f:
+            log = f.read().split("\n")
+        setups = [line.split() for line in log if line and line != "teardown"]
+        self.assertEqual(
+            [s[1:] for s in setups],
+            [["1", "0.0"], ["1", "5.0"], ["2", "0.0"], ["2", "5.0"]],
+        )
+        self.assertEqual(len({s[0] for s in setups}), 1)
+        self.assertEqual(log.count("teardown"), 6)
+
+    def test_sweep_subset(self):
+        proc = self.run_benchmark("grid.Grid.track_grid", {"sweep": [4, 0]})
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        with open(self.result_file) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["param_idx"] for r in records], [4, 0])
+        self.assertEqual(records[1]["result"], 11)
+
+        # Sweeps take the benchmark name, and valid indices only
+        for benchmark_id, sweep in (
+            ("grid.Grid.track_grid-0", True),
+            ("grid.Grid.track_grid", [6]),
+        ):
+            proc = self.run_benchmark(benchmark_id, {"sweep": sweep})
+            self.assertNotEqual(proc.returncode, 0)
+            self.assertIn("ValueError", proc.stderr)
+
+    def test_single_run_unchanged(self):
+        proc = self.run_benchmark("grid.Grid.track_grid-0", {})
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        with open(self.result_file) as f:
+            self.assertEqual(json.load(f), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,562 @@
+# Fork server (asv_runner.server) driven over its UNIX socket protocol.
+
+import json
+import os
+import pickle
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+
+_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from asv_runner._aux import recvall  # noqa: E402
+from asv_runner.server import (  # noqa: E402
+    _OutputBuffer,
+    _partition_cpus,
+    _SampleRing,
+)
+
+BENCH_SOURCE = textwrap.dedent(
+    """
+    import gc
+    import os
+    import time
+
+    def track_pid(n):
+        return os.getpid()
+
+    track_pid.params = [1, 2]
+
+    def track_sleep(n):
+        time.sleep(n)
+        return n
+
+    track_sleep.params = [0.0, 0.5, 5.0]
+
+    def track_print():
+        print("hello from the child")
+        return 1
+
+    def track_alloc():
+        return len(b"x" * (64 << 20))
+
+    def track_freeze_count():
+        return gc.get_freeze_count()
+
+    def time_slow():
+        time.sleep(0.05)
+
+    time_slow.number = 1
+    time_slow.warmup_time = 0
+    time_slow.repeat = 1000
+
+    class Counted:
+        instances = 0
+
+        def __init__(self):
+            Counted.instances += 1
+
+        def track_instances(self):
+            return Counted.instances
+
+    class Cached:
+        def setup_cache(self):
+            return None
+
+        def track_cache(self, cache):
+            return cache
+
+    def track_print_lots():
+        for i in range(10000):
+            print(f"line {i}")
+        return 1
+
+    def track_print_megabytes():
+        print("x" * (3 << 20))
+        return 1
+    """
+)
+
+
+def _write_message(s, msg):
+    data = json.dumps(msg).encode("utf-8")
+    s.sendall(struct.pack("<Q", len(data)))
+    s.sendall(data)
+
+
+def _read_message(s):
+    (size,) = struct.unpack("<Q", recvall(s, 8))
+    return json.loads(recvall(s, size).decode("utf-8"))
+
+
+def _send_command(socket_name, msg, reply=True):
+    """Minimal client, mirroring asv's ``ForkServer._send_command``."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(socket_name)
+    try:
+        _write_message(s, msg)
+        if not reply:
+            return None
+        return _read_message(s)
+    finally:
+        s.close()
+
+
+class ServerTestCase(unittest.TestCase):
+    workers = 1
+    # Code run in the server process before it starts serving
+    prelude = ""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.benchmark_dir = os.path.join(self.tmpdir, "benchmarks")
+        os.mkdir(self.benchmark_dir)
+        with open(os.path.join(self.benchmark_dir, "__init__.py"), "w"):
+            pass
+        with open(os.path.join(self.benchmark_dir, "bench.py"), "w") as f:
+            f.write(BENCH_SOURCE)
+        self.socket_name = os.path.join(self.tmpdir, "server.sock")
+        env = dict(os.environ, PYTHONPATH=_ROOT)
+        self.proc = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "import sys; import asv_runner.server\n"
+                + self.prelude
+                + "\nasv_runner.server._run_server(sys.argv[1:])",
+                self.benchmark_dir,
+                self.socket_name,
+                str(self.workers),
+            ],
+            env=env,
+        )
+        deadline = time.time() + 30
+        while True:
+            self.assertIsNone(self.proc.poll(), "server exited early")
+            self.assertLess(time.time(), deadline, "server did not start")
+            # The socket file exists slightly before the server listens on it
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                s.connect(self.socket_name)
+                break
+            except OSError:
+                time.sleep(0.01)
+            finally:
+                s.close()
+
+    def tearDown(self):
+        if self.proc.poll() is None:
+            _send_command(self.socket_name, {"action": "quit"}, reply=False)
+            self.proc.wait(timeout=30)
+        shutil.rmtree(self.tmpdir)
+
+    def run_command(self, benchmark_id, timeout=60, params=None, **extra):
+        result_file = os.path.join(self.tmpdir, f"{benchmark_id}.{time.time()}")
+        return {
+            **extra,
+            "action": "run",
+            "benchmark_id": benchmark_id,
+            "params_str": json.dumps(params or {}),
+            "profile_path": "None",
+            "result_file": result_file,
+            "timeout": timeout,
+            "cwd": self.tmpdir,
+        }
+
+    def load_result(self, command, info):
+        if os.path.exists(command["result_file"]):
+            with open(command["result_file"]) as f:
+                info["result"] = json.load(f)
+        return info
+
+    def run_benchmark(self, benchmark_id, timeout=60, params=None, **extra):
+        command = self.run_command(
+            benchmark_id, timeout=timeout, params=params, **extra
+        )
+        return self.load_result(command, _send_command(self.socket_name, command))
+
+
+class TestServer(ServerTestCase):
+    def test_run_reports_output_and_result(self):
+        info = self.run_benchmark("bench.track_print")
+        self.assertEqual(info["errcode"], 0)
+        self.assertIn("hello from the child", info["out"])
+        self.assertEqual(info["result"], 1)
+
+    def test_rusage(self):
+        info = self.run_benchmark("bench.track_alloc")
+        self.assertEqual(info["errcode"], 0)
+        usage = info["rusage"]
+        self.assertGreaterEqual(usage["maxrss"], 64 << 20)
+        self.assertGreater(usage["utime"] + usage["stime"], 0)
+        for key in ("minflt", "majflt", "nvcsw", "nivcsw"):
+            self.assertIsInstance(usage[key], int)
+
+    @unittest.skipUnless(
+        os.path.exists("/proc/self/smaps_rollup"), "requires smaps_rollup"
+    )
+    def test_memory_report(self):
+        info = self.run_benchmark("bench.track_print")
+        memory = info["memory"]
+        self.assertGreater(memory["pss"], 0)
+        self.assertGreater(memory["private_dirty"], 0)
+        self.assertGreaterEqual(memory["private_clean"], 0)
+
+    def test_output_limit(self):
+        info = self.run_benchmark("bench.track_print_lots")
+        self.assertTrue(info["out"].startswith("line 0\n"))
+        self.assertTrue(info["out"].endswith("line 9999\n"))
+
+        info = self.run_benchmark("bench.track_print_lots", output_limit=100)
+        self.assertEqual(info["errcode"], 0)
+        self.assertTrue(info["out"].startswith("[asv: "))
+        self.assertIn("bytes of output truncated]", info["out"])
+        self.assertTrue(info["out"].endswith("line 9999\n"))
+        self.assertLess(len(info["out"]), 200)
+
+    def test_timeout(self):
+        info = self.run_benchmark("bench.track_sleep-2", timeout=0.2)
+        self.assertEqual(info["errcode"], -256)
+        # Stacks of the hung child are dumped before it is killed
+        self.assertIn("most recent call first", info["out"])
+        self.assertIn("track_sleep", info["out"])
+
+        info = self.run_benchmark("bench.track_sleep-2", timeout=0.2, stack_dump=False)
+        self.assertEqual(info["errcode"], -256)
+        self.assertNotIn("most recent call first", info["out"])
+
+    def test_timeout_stack_samples(self):
+        info = self.run_benchmark(
+            "bench.track_sleep-2", timeout=0.6, stack_sample_time=0.35
+        )
+        self.assertEqual(info["errcode"], -256)
+        # A few samples, then the final dump
+        self.assertGreaterEqual(info["out"].count("track_sleep"), 3)
+
+    def test_timeout_reports_partial_samples(self):
+        info = self.run_benchmark("bench.time_slow", timeout=0.6)
+        self.assertEqual(info["errcode"], -256)
+        self.assertNotIn("result", info)
+        partial = info["partial"]
+        self.assertEqual(partial["number"], 1)
+        self.assertGreaterEqual(len(partial["samples"]), 3)
+        for sample in partial["samples"]:
+            self.assertGreaterEqual(sample, 0.05)
+
+        # Benchmarks that do not time out report their result as usual
+        info = self.run_benchmark("bench.track_sleep-0")
+        self.assertNotIn("partial", info)
+
+    def run_many(self, benchmark_ids, isolation, timeout=60):
+        commands = [self.run_command(b, timeout=timeout) for b in benchmark_ids]
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.socket_name)
+        try:
+            _write_message(
+                s, {"action": "run_many", "items": commands, "isolation": isolation}
+            )
+            replies = [_read_message(s) for _ in commands]
+            # One-shot connection is closed after the last item
+            self.assertEqual(s.recv(1), b"")
+        finally:
+            s.close()
+        replies.sort(key=lambda reply: reply["index"])
+        return [self.load_result(c, r) for c, r in zip(commands, replies)]
+
+    def test_run_many_isolation(self):
+        ids = ["bench.track_pid-0", "bench.track_pid-1", "bench.track_print"]
+        item = self.run_many(ids, "item")
+        self.assertEqual([r["errcode"] for r in item], [0, 0, 0])
+        self.assertNotEqual(item[0]["result"], item[1]["result"])
+
+        grouped = self.run_many(ids, "benchmark")
+        self.assertEqual([r["errcode"] for r in grouped], [0, 0, 0])
+        self.assertEqual(grouped[0]["result"], grouped[1]["result"])
+        self.assertNotEqual(grouped[0]["result"], grouped[2]["result"])
+        self.assertIn("hello from the child", grouped[2]["out"])
+        self.assertNotIn("hello from the child", grouped[0]["out"])
+
+    def test_run_many_timeout_keeps_finished_items(self):
+        ids = ["bench.track_sleep-0", "bench.track_sleep-2"]
+        replies = self.run_many(ids, "benchmark", timeout=0.3)
+        self.assertEqual([r["errcode"] for r in replies], [0, -256])
+        self.assertEqual(replies[0]["result"], 0.0)
+
+    def test_unread_reply_does_not_block(self):
+        session = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        session.connect(self.socket_name)
+        try:
+            _write_message(session, {"action": "session"})
+            self.assertEqual(_read_message(session), {"protocol": 1})
+            command = self.run_command("bench.track_print_megabytes")
+            _write_message(session, dict(command, request_id="big"))
+
+            # The reply of the session is not read in the meantime
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(self.socket_name)
+            s.settimeout(20)
+            try:
+                _write_message(s, self.run_command("bench.track_sleep-0", timeout=2))
+                self.assertEqual(_read_message(s)["errcode"], 0)
+            finally:
+                s.close()
+
+            reply = _read_message(session)
+        finally:
+            session.close()
+        self.assertEqual(reply["request_id"], "big")
+        self.assertGreater(len(reply["out"]), 3 << 20)
+
+    def test_partial_command_does_not_block(self):
+        command = self.run_command("bench.track_sleep-0")
+        data = json.dumps(command).encode("utf-8")
+        message = struct.pack("<Q", len(data)) + data
+        idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        idle.connect(self.socket_name)
+        idle.settimeout(20)
+        try:
+            # Half a message, the rest of which comes later
+            idle.sendall(message[:4])
+
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.connect(self.socket_name)
+            s.settimeout(20)
+            try:
+                start = time.time()
+                _write_message(s, self.run_command("bench.track_sleep-2", timeout=1))
+                self.assertEqual(_read_message(s)["errcode"], -256)
+                self.assertLess(time.time() - start, 3)
+            finally:
+                s.close()
+
+            idle.sendall(message[4:])
+            self.assertEqual(_read_message(idle)["errcode"], 0)
+        finally:
+            idle.close()
+
+    def test_run_many_streams_finished_items(self):
+        ids = ["bench.track_sleep-0", "bench.track_sleep-2"]
+        commands = [self.run_command(b, timeout=1) for b in ids]
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.socket_name)
+        try:
+            start = time.time()
+            _write_message(
+                s, {"action": "run_many", "items": commands, "isolation": "benchmark"}
+            )
+            first = _read_message(s)
+            elapsed = time.time() - start
+            last = _read_message(s)
+        finally:
+            s.close()
+        # Answered before the second item of the child times out
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual((first["index"], first["errcode"]), (0, 0))
+        self.assertNotIn("rusage", first)
+        self.assertEqual((last["index"], last["errcode"]), (1, -256))
+        self.assertIn("rusage", last)
+
+    def test_preimport(self):
+        out = _send_command(self.socket_name, {"action": "preimport"})
+        self.assertIsInstance(out, str)
+        self.assertEqual(self.run_benchmark("bench.track_sleep-0")["errcode"], 0)
+        self.assertEqual(self.run_benchmark("bench.track_freeze_count")["result"], 0)
+
+    def test_preimport_freeze(self):
+        out = _send_command(self.socket_name, {"action": "preimport", "freeze": True})
+        self.assertIsInstance(out, str)
+        self.assertGreater(self.run_benchmark("bench.track_freeze_count")["result"], 0)
+
+
+class _UnpicklerPid:
+    """Unpickles to the process id of the process that loaded it."""
+
+    def __reduce__(self):
+        return os.getpid, ()
+
+
+class TestServerIndex(ServerTestCase):
+    def test_preimport_index(self):
+        benchmark_id = "bench.Counted.track_instances"
+        self.assertEqual(self.run_benchmark(benchmark_id)["result"], 1)
+        # Without the index, the child would create a second instance
+        _send_command(self.socket_name, {"action": "preimport"})
+        self.assertEqual(self.run_benchmark(benchmark_id)["result"], 1)
+        replies = self.run_many(["bench.Counted.track_instances"] * 2, "benchmark")
+        self.assertEqual([r["result"] for r in replies], [1, 2])
+
+    def test_preimport_setup_caches(self):
+        with open(os.path.join(self.tmpdir, "cache.pickle"), "wb") as f:
+            pickle.dump(_UnpicklerPid(), f)
+        _send_command(self.socket_name, {"action": "preimport", "setup_caches": True})
+        for _ in range(2):
+            info = self.run_benchmark("bench.Cached.track_cache")
+            self.assertEqual(info["result"], self.proc.pid)
+
+        # A changed cache file is loaded again
+        with open(os.path.join(self.tmpdir, "cache.pickle"), "wb") as f:
+            pickle.dump(42, f)
+        self.assertEqual(self.run_benchmark("bench.Cached.track_cache")["result"], 42)
+
+    run_benchmark = TestServer.run_benchmark
+    run_many = TestServer.run_many
+
+
+class TestRecvall(unittest.TestCase):
+    def test_chunked_and_short_reads(self):
+        a, b = socket.socketpair()
+        try:
+            a.sendall(b"abc")
+            a.sendall(b"defg")
+            self.assertEqual(recvall(b, 7), b"abcdefg")
+            a.sendall(b"xy")
+            a.close()
+            with self.assertRaises(RuntimeError):
+                recvall(b, 4)
+        finally:
+            b.close()
+
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_ring_keeps_tail(self):
+        buf = _OutputBuffer(8)
+        buf.write(b"abcd")
+        self.assertEqual(buf.getvalue(), "abcd")
+        buf.write(b"efghij")
+        buf.write(b"kl")
+        self.assertEqual(buf.getvalue(), "[asv: 4 bytes of output truncated]\nefghijkl")
+
+    def test_read_from_pipe(self):
+        r, w = os.pipe()
+        try:
+            os.set_blocking(r, False)
+            buf = _OutputBuffer(1 << 20)
+            for _ in range(3):
+                os.write(w, b"x" * 50000)
+                self.assertTrue(buf.read_from(r))
+            os.close(w)
+            w = None
+            self.assertFalse(buf.read_from(r))
+            self.assertEqual(buf.getvalue(), "x" * 150000)
+        finally:
+            os.close(r)
+            if w is not None:
+                os.close(w)
+
+
+class TestSampleRing(unittest.TestCase):
+    def test_keeps_last_samples(self):
+        ring = _SampleRing(capacity=3)
+        try:
+            ring.reset()
+            self.assertIsNone(ring.get_result())
+            for timing in [2.0, 4.0, 6.0, 8.0]:
+                ring.append(timing, 2)
+            self.assertEqual(
+                ring.get_result(), {"samples": [2.0, 3.0, 4.0], "number": 2}
+            )
+        finally:
+            ring.close()
+
+
+class TestServerSigchld(TestServer):
+    """Child exits observed through the SIGCHLD self-pipe instead of pidfds."""
+
+    prelude = "asv_runner.server._open_pidfd = lambda pid: None"
+
+
+class TestServerWorkers(ServerTestCase):
+    workers = 2
+
+    def test_concurrent_children(self):
+        results = []
+
+        def client():
+            results.append(self.run_benchmark("bench.track_sleep-1"))
+
+        start = time.time()
+        threads = [threading.Thread(target=client) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        self.assertEqual([r["errcode"] for r in results], [0, 0])
+        self.assertEqual([r["result"] for r in results], [0.5, 0.5])
+        # Both children slept at the same time
+        self.assertLess(elapsed, 0.95)
+
+    def test_session_pipelines_out_of_order(self):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.socket_name)
+        try:
+            _write_message(s, {"action": "session"})
+            self.assertEqual(_read_message(s), {"protocol": 1})
+
+            commands = {
+                "slow": self.run_command("bench.track_sleep-1"),
+                "fast-1": self.run_command("bench.track_sleep-0"),
+                "fast-2": self.run_command("bench.track_print"),
+            }
+            for request_id, command in commands.items():
+                _write_message(s, dict(command, request_id=request_id))
+            _write_message(s, {"action": "preimport", "request_id": "pre"})
+
+            replies = [_read_message(s) for _ in range(4)]
+        finally:
+            s.close()
+
+        order = [reply["request_id"] for reply in replies]
+        self.assertEqual(sorted(order), ["fast-1", "fast-2", "pre", "slow"])
+        self.assertEqual(order[-1], "slow")
+        for reply in replies:
+            if reply["request_id"] == "pre":
+                self.assertIsInstance(reply["out"], str)
+                continue
+            self.assertEqual(reply["errcode"], 0)
+            info = self.load_result(commands[reply["request_id"]], reply)
+            self.assertIn("result", info)
+
+    def test_malformed_commands_rejected(self):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(self.socket_name)
+        try:
+            _write_message(s, {"action": "session"})
+            self.assertEqual(_read_message(s), {"protocol": 1})
+            _write_message(
+                s, dict(self.run_command("bench.track_sleep-1"), request_id="ok")
+            )
+            _write_message(s, {"action": "run", "request_id": "bad"})
+            reply = _read_message(s)
+            self.assertEqual(reply["request_id"], "bad")
+            self.assertIn("benchmark_id", reply["error"])
+            # The command in flight is still answered, then the session closed
+            self.assertEqual(_read_message(s)["request_id"], "ok")
+            self.assertEqual(s.recv(1), b"")
+        finally:
+            s.close()
+
+        reply = _send_command(self.socket_name, {"action": "run_many", "items": 1})
+        self.assertIn("error", reply)
+        # The server keeps serving other clients
+        self.assertEqual(self.run_benchmark("bench.track_sleep-0")["errcode"], 0)
+
+    def test_partition_cpus_disjoint(self):
+        cpu_sets = [c for c in _partition_cpus(4) if c is not None]
+        flat = [cpu for cpu_set in cpu_sets for cpu in cpu_set]
+        self.assertEqual(len(flat), len(set(flat)))
+        self.assertEqual(_partition_cpus(1), [None])
+
+
+if __name__ == "__main__":
+    unittest.main()
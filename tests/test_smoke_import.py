@@ -1,7 +1,11 @@
 """Smoke tests shipped with CI-only PRs (no behavior change to the package)."""
 
 import ast
+import os
 import pathlib
+import subprocess
+import sys
+import textwrap
 import unittest
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
@@ -21,6 +25,25 @@ class TestSmokeImport(unittest.TestCase):
         import asv_runner.setup_cache  # noqa: F401
         import asv_runner.timing  # noqa: F401
 
+    def test_import_server_without_sigusr1(self):
+        # Windows has no SIGUSR1; asv imports the server module regardless
+        code = textwrap.dedent(
+            """
+            import signal
+
+            del signal.SIGUSR1
+            import asv_runner.server as server
+
+            command = {key: None for key in server._RUN_KEYS}
+            command["stack_sample_time"] = 1.0
+            parsed = server._parse_run_command(command)
+            assert parsed["stack_sample_time"] == 0.0, parsed
+            """
+        )
+        subprocess.check_call(
+            [sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=str(ROOT))
+        )
+
     def test_package_is_py37_syntax(self):
         # Static gate: no 3.8+ syntax nodes in runtime package.
         for path in sorted(PKG.rglob("*.py")):